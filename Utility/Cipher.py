@@ -1,13 +1,18 @@
 from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP
+from Crypto.Cipher import PKCS1_OAEP, AES
 from Crypto.Hash import SHA256
+from Crypto.Random import get_random_bytes
 import base64
 from binascii import hexlify, unhexlify
+import os
+import threading
 
 class cipher():
     def __init__(self):
         self.public_key_pem = self.read_key_pem("secret/public_key.pem")
         self.private_key_pem = self.read_key_pem("secret/private_key.pem")
+        # Parsing the PEM dominates decrypt time, so the private key is imported once
+        self._decryptor = None
         
     def generate_rsa_keys(key_size=2048):
         """
@@ -35,9 +40,11 @@ class cipher():
         """
         Decrypts an encrypted message using the RSA private key.
         """
-        private_key = RSA.import_key(self.private_key_pem)
-        cipher_rsa = PKCS1_OAEP.new(private_key, hashAlgo=SHA256)
-        
+        if self._decryptor is None:
+            private_key = RSA.import_key(self.private_key_pem)
+            self._decryptor = PKCS1_OAEP.new(private_key, hashAlgo=SHA256)
+        cipher_rsa = self._decryptor
+
         try:
             encode = encrypted_message.encode('ascii')
             decode = base64.b64decode(encode)
@@ -64,6 +71,59 @@ class cipher():
             print(f"An error occurred while reading the private key file: {e}")
             return None
         
+class SessionCipher():
+    """
+    AES-GCM for the cached mCV tokens and cookies (auth_session), which are too long for RSA
+    and give the same access to the account as the password.
+    The 256-bit key lives next to the RSA pair and is generated on first use.
+    """
+    KEY_PATH = "secret/session_key.bin"
+
+    def __init__(self, key_path=KEY_PATH):
+        self.key_path = key_path
+        self._key = None
+        self._lock = threading.Lock()
+
+    def _load_key(self):
+        with self._lock:
+            if self._key is None:
+                try:
+                    with open(self.key_path, 'rb') as f:
+                        self._key = f.read()
+                except FileNotFoundError:
+                    os.makedirs(os.path.dirname(self.key_path) or ".", exist_ok=True)
+                    key = get_random_bytes(32)
+                    try:
+                        # Owner-only, and never overwrite a key another process just wrote
+                        fd = os.open(self.key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    except FileExistsError:
+                        with open(self.key_path, 'rb') as f:
+                            key = f.read()
+                    else:
+                        with os.fdopen(fd, 'wb') as f:
+                            f.write(key)
+                    self._key = key
+            return self._key
+
+    def encrypt(self, message):
+        """Encrypts a str, returns base64 of nonce + tag + ciphertext (None stays None)."""
+        if message is None:
+            return None
+        cipher_aes = AES.new(self._load_key(), AES.MODE_GCM)
+        ciphertext, tag = cipher_aes.encrypt_and_digest(message.encode('utf8'))
+        return base64.b64encode(cipher_aes.nonce + tag + ciphertext).decode('ascii')
+
+    def decrypt(self, encrypted_message):
+        """
+        Decrypts a value from encrypt(). Raises ValueError when it was not encrypted with this key.
+        """
+        if encrypted_message is None:
+            return None
+        data = base64.b64decode(encrypted_message.encode('ascii'), validate=True)
+        nonce, tag, ciphertext = data[:16], data[16:32], data[32:]
+        cipher_aes = AES.new(self._load_key(), AES.MODE_GCM, nonce=nonce)
+        return cipher_aes.decrypt_and_verify(ciphertext, tag).decode('utf8')
+
 if __name__ == "__main__":
     c = cipher()
     comm = input("what:")
@@ -0,0 +1,105 @@
+import argparse
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from Utility.logger import DB_PATH
+
+LogRow = namedtuple("LogRow", "id timestamp level source message data")
+
+RETENTION_DAYS = 30
+VACUUM_FREE_RATIO = 0.25    # VACUUM once this share of the file is free pages
+
+
+def _connect(db_path=DB_PATH):
+    return sqlite3.connect(db_path, timeout=5)
+
+
+def query_logs(source=None, level=None, since=None, until=None, limit=50, page=1, db_path=DB_PATH):
+    """
+    Filters log rows, newest first.
+
+    Args:
+        source (str | None): Exact source, e.g. "update_assm".
+        level (str | None): INFO, WARNING, ERROR or DEBUG.
+        since (str | None): Inclusive lower bound, "YYYY-MM-DD[ HH:MM:SS]" in Bangkok time like the column.
+        until (str | None): Exclusive upper bound, same format.
+        limit (int): Rows per page.
+        page (int): 1-based page number.
+
+    Returns:
+        list[LogRow]: The rows of the requested page.
+    """
+    where, params = [], []
+    for column, value in (("source", source), ("level", level)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        where.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        where.append("timestamp < ?")
+        params.append(until)
+    query = f"""
+        SELECT id, timestamp, level, source, message, data FROM log
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ? OFFSET ?;
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(query, (*params, limit, (page - 1) * limit)).fetchall()
+    finally:
+        conn.close()
+    return [LogRow._make(row) for row in rows]
+
+
+def prune_logs(days=RETENTION_DAYS, db_path=DB_PATH):
+    """
+    Rolls log rows older than `days` up into log_daily (count per day/source/level), deletes them
+    and VACUUMs when enough of the file has become free pages.
+
+    Returns:
+        int: Number of log rows deleted.
+    """
+    cutoff = (datetime.now(timezone.utc) + timedelta(hours=7) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO log_daily (day, source, level, count)
+                SELECT date(timestamp), source, level, COUNT(*) FROM log
+                WHERE timestamp < ?
+                GROUP BY date(timestamp), source, level
+                ON CONFLICT(day, source, level) DO UPDATE SET count = count + excluded.count;
+            """, (cutoff,))
+            deleted = conn.execute("DELETE FROM log WHERE timestamp < ?;", (cutoff,)).rowcount
+        free = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        total = conn.execute("PRAGMA page_count;").fetchone()[0]
+        if total and free / total >= VACUUM_FREE_RATIO:
+            conn.execute("VACUUM;")
+    finally:
+        conn.close()
+    return deleted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query and prune database/log.db.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("query", help="filter log rows, newest first")
+    q.add_argument("--source")
+    q.add_argument("--level", type=str.upper)
+    q.add_argument("--since", help='e.g. "2025-01-31" or "2025-01-31 18:00:00"')
+    q.add_argument("--until")
+    q.add_argument("--limit", type=int, default=50)
+    q.add_argument("--page", type=int, default=1)
+    p = sub.add_parser("prune", help="roll up and delete rows older than --days")
+    p.add_argument("--days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    if args.command == "query":
+        for row in query_logs(args.source, args.level, args.since, args.until, args.limit, args.page):
+            print(f"{row.id:>8} {row.timestamp} {row.level:<7} {row.source:<14} {row.message}" + (f" | {row.data}" if row.data else ""))
+    else:
+        print(f"Pruned {prune_logs(args.days)} log rows older than {args.days} days")
@@ -1,18 +1,125 @@
+import atexit
+import os
+import queue
 import sqlite3
+import threading
+import time
 
 DB_PATH = "database/log.db"
+FLUSH_SIZE = 200        # flush once this many records are queued
+FLUSH_INTERVAL = 2.0    # or after this many seconds
+
+# Synchronous mode writes every record before returning (tests, one-off scripts)
+SYNC = os.getenv("LOG_SYNC", "0") == "1"
+
+_queue = queue.Queue()
+_STOP = object()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _record(level, source, message, data):
+    # Callers pass exceptions and other objects as data, sqlite only binds text
+    if data is not None and not isinstance(data, str):
+        data = str(data)
+    return (level, source, str(message), data, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() + 7 * 3600)))
+
+
+def _write(records):
+    conn = sqlite3.connect(DB_PATH, timeout=5)
+    try:
+        conn.executemany("""
+            INSERT INTO log (level, source, message, data, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+        """, records)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _drain(block_timeout=None):
+    """
+    Take up to FLUSH_SIZE queued records. With block_timeout, wait that long for the first
+    record, then keep collecting until FLUSH_SIZE records or block_timeout after the first one;
+    without it, only take what is already queued.
+    Returns (records, stop) where stop is True if the writer was asked to exit.
+    """
+    records = []
+    try:
+        item = _queue.get(timeout=block_timeout) if block_timeout else _queue.get_nowait()
+        deadline = time.monotonic() + (block_timeout or 0)
+        while item is not _STOP:
+            records.append(item)
+            if len(records) >= FLUSH_SIZE:
+                break
+            remaining = deadline - time.monotonic()
+            item = _queue.get(timeout=remaining) if block_timeout and remaining > 0 else _queue.get_nowait()
+        else:
+            return records, True
+    except queue.Empty:
+        pass
+    return records, False
+
+
+def _write_safe(records):
+    try:
+        _write(records)
+    except sqlite3.Error as e:
+        print(f"Failed to write {len(records)} log records: {e}")
+
+
+def _run():
+    """Background writer: batches queued records, flushing on FLUSH_SIZE or FLUSH_INTERVAL."""
+    while True:
+        records, stop = _drain(FLUSH_INTERVAL)
+        if records:
+            _write_safe(records)
+        if stop:
+            return
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name="log-writer", daemon=True)
+            _writer.start()
+
+
+def flush():
+    """Write every queued record now, in order (also run at interpreter exit)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer.is_alive():
+            # The writer drains everything queued before the stop marker, then exits
+            _queue.put(_STOP)
+            _writer.join()
+        _writer = None
+    while True:
+        records, _ = _drain()
+        if not records:
+            return
+        _write_safe(records)
+
+
+def set_sync(enabled=True):
+    """Switch between synchronous writes and the buffered background writer."""
+    global SYNC
+    if enabled:
+        flush()
+    SYNC = enabled
+
 
 def log(level, source, message, data=None):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    record = _record(level, source, message, data)
+    if SYNC:
+        _write([record])
+        return
+    _queue.put(record)
+    _start_writer()
 
-    cur.execute("""
-        INSERT INTO log (level, source, message, data)
-        VALUES (?, ?, ?, ?)
-    """, (level, source, message, data if data else None))
 
-    conn.commit()
-    conn.close()
+atexit.register(flush)
 
 # Convenience shortcuts
 def info(source, message, data=None): log("INFO", source, message, data)
@@ -1,4 +1,4 @@
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import re
 import json
 
@@ -20,6 +20,29 @@ def format_due_date(iso_date_str: str) -> str:
     except ValueError:
         return "N/A"
 
+BANGKOK_TZ = timezone(timedelta(hours=7))
+
+def to_epoch(iso_date_str: str) -> int | None:
+    """
+    Converts an ISO 8601 date string to a UTC epoch in seconds.
+    Strings without an offset are taken as Bangkok time (UTC+7), like the rest of the stored dates.
+
+    Args:
+        iso_date_str (str): The date string in ISO 8601 format (e.g., "2023-11-10T23:59:00+07:00").
+
+    Returns:
+        int | None: Seconds since the epoch, or None if the string is empty or invalid.
+    """
+    if not iso_date_str:
+        return None
+    try:
+        dt_object = datetime.fromisoformat(iso_date_str)
+    except ValueError:
+        return None
+    if dt_object.tzinfo is None:
+        dt_object = dt_object.replace(tzinfo=BANGKOK_TZ)
+    return int(dt_object.timestamp())
+
 def calculate_time_left(due_date_str: str, current_time: datetime) -> tuple[str, int | None]:
     """
     Calculates the time remaining until a due date or returns "Overdue".
@@ -82,6 +105,9 @@ def calculate_time_left(due_date_str: str, current_time: datetime) -> tuple[str,
         print(f"Error calculating time left for {due_date_str}: {e}")
         return "N/A", None
       
+# Match placeholders like <TITLE>
+PLACEHOLDER_PATTERN = re.compile(r'<(.*?)>')
+
 def replace_placeholders(json_string: str, values: dict) -> str:
     """    Replaces placeholders in a JSON string with corresponding values from a dictionary.
     This function searches for placeholders in the format <KEY> within the JSON string
@@ -93,14 +119,11 @@ def replace_placeholders(json_string: str, values: dict) -> str:
     Returns:
         str: The JSON string with placeholders replaced by their corresponding values.
     """
-    # Match placeholders like <TITLE>
-    pattern = re.compile(r'<(.*?)>')
-    
     def replacer(match):
         key = match.group(1)
         return values.get(key, match.group(0))  # Keep original if key not found
     
-    return pattern.sub(replacer, json_string)
+    return PLACEHOLDER_PATTERN.sub(replacer, json_string)
 
 def json2dict(json_string: str) -> dict:
     """
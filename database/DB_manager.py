@@ -1,39 +1,234 @@
 import sqlite3
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from Utility.utility import to_epoch
+from database.connection import get_pool
+from database import instrument
+from Utility.Cipher import SessionCipher
 
+DAY = 86400
+
+# auth_session tokens and cookies are stored encrypted with secret/session_key.bin
+session_cipher = SessionCipher()
+
+# notification_schedule kinds: seconds before due_epoch each reminder fires
+NOTIFY_LEADS = {"3d": 3 * DAY, "1d": DAY}
+NOTIFY_LEAD_SQL = "CASE kind " + " ".join(f"WHEN '{kind}' THEN {lead}" for kind, lead in NOTIFY_LEADS.items()) + " END"
+NOTIFY_KINDS_SQL = " UNION ALL ".join(f"SELECT '{kind}' AS kind, {lead} AS lead" for kind, lead in NOTIFY_LEADS.items())
+
+# Every due user's open assignments (next 7 days) with their 1d/3d flags, in one statement.
+# Rows come out grouped by user then course. The due users come from a range scan over the
+# pending schedule (idx_notification_schedule_pending).
+# A 3d reminder stays live until 1 day before due, when the 1d one takes over; a 1d one until due.
+FETCH_SCHEDULED_ROWS_SQL = f"""
+    WITH due AS (
+        SELECT DISTINCT s.user_id
+        FROM notification_schedule s
+        WHERE 
+            s.sent_at IS NULL
+            AND s.fire_at_epoch BETWEEN :live_3d AND :now
+            AND s.fire_at_epoch >= (CASE s.kind WHEN '3d' THEN :live_3d ELSE :live_1d END)
+    )
+    SELECT 
+        ua.user_id,
+        u.Line_uid,
+        a.assignment_id,
+        a.name AS assignment_name,
+        a.due_date,
+        a.type AS assignment_type,
+        ua.status,
+        c.course_id,
+        c.name AS course_name,
+        c.courseNumber,
+        c.thumbnail,
+        c.semester,
+        EXISTS (
+            SELECT 1 FROM notification_schedule s
+            WHERE s.user_id = ua.user_id AND s.assignment_id = ua.assignment_id AND s.kind = '1d'
+                AND s.sent_at IS NULL AND s.fire_at_epoch BETWEEN :live_1d AND :now
+        ) AS due_1d,
+        EXISTS (
+            SELECT 1 FROM notification_schedule s
+            WHERE s.user_id = ua.user_id AND s.assignment_id = ua.assignment_id AND s.kind = '3d'
+                AND s.sent_at IS NULL AND s.fire_at_epoch BETWEEN :live_3d AND :now
+        ) AS due_3d
+    FROM due
+    JOIN user u ON u.user_id = due.user_id
+    JOIN user_assignments ua ON ua.user_id = due.user_id
+    JOIN assignment a ON ua.assignment_id = a.assignment_id
+    JOIN course c ON a.course_id = c.course_id
+    WHERE a.due_epoch BETWEEN :now AND :d7
+    ORDER BY ua.user_id, c.course_id, a.due_epoch;
+"""
+
+# Row types returned by the streaming iter_* methods
+UserRow = namedtuple("UserRow", "user_id cname cpass")
+OpenAssignmentRow = namedtuple("OpenAssignmentRow",
+    "assignment_id assignment_name due_date assignment_type status course_id course_name courseNumber thumbnail semester")
+NotifyRow = namedtuple("NotifyRow",
+    "user_id Line_uid assignment_id assignment_name due_date assignment_type status "
+    "course_id course_name courseNumber thumbnail semester due_1d due_3d")
+
+BATCH_SIZE = 500
+
+# A sync job failing this many times (bad credentials, removed account) is left out of --resume
+MAX_JOB_ATTEMPTS = 3
+UNFINISHED_JOB_SQL = f"(status = 'pending' OR (status != 'done' AND attempts < {MAX_JOB_ATTEMPTS}))"
+
+ARCHIVE_PATH = "database/archive.db"
+
+# Same columns as the hot tables, attached as schema "archive"
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS archive.course (
+        course_id TEXT PRIMARY KEY,
+        name TEXT,
+        type TEXT,
+        courseNumber TEXT,
+        thumbnail TEXT,
+        semester TEXT,
+        archived_at TEXT DEFAULT (datetime('now', '+7 hours')),
+        courseYear TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive.assignment (
+        assignment_id TEXT PRIMARY KEY,
+        course_id TEXT,
+        due_date DATETIME,
+        name TEXT,
+        type TEXT,
+        due_epoch INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive.user_assignments (
+        user_id TEXT,
+        assignment_id TEXT,
+        notify_1d BOOLEAN DEFAULT FALSE,
+        notify_3d BOOLEAN DEFAULT FALSE,
+        status TEXT,
+        PRIMARY KEY (user_id, assignment_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_assignment_course ON assignment(course_id)",
+)
+
+HISTORY_SQL = """
+    SELECT 
+        a.assignment_id,
+        a.name AS assignment_name,
+        a.due_date,
+        a.type AS assignment_type,
+        ua.status,
+        c.course_id,
+        c.name AS course_name,
+        c.courseNumber,
+        c.thumbnail,
+        c.semester
+    FROM archive.user_assignments ua
+    JOIN archive.assignment a ON ua.assignment_id = a.assignment_id
+    JOIN archive.course c ON a.course_id = c.course_id
+    WHERE 
+        ua.user_id = :user_id
+        AND (:semester IS NULL OR c.semester = :semester)
+    ORDER BY a.due_epoch DESC;
+"""
 
 class DBManager:
     def __init__(self, db_name="database/main.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.cur = self.conn.cursor()
+        # Connections come from a shared WAL pool and go back to it on close()
+        self._pool = get_pool(db_name)
+        self.conn = self._pool.acquire()
+        self.cur = self._cursor()
+        self._archive_attached = False
+
+    def _cursor(self, name=None):
+        # Plain sqlite3 cursor unless query stats are on (DB_STATS=1 or instrument.set_enabled())
+        cur = self.conn.cursor()
+        return instrument.InstrumentedCursor(cur, name) if instrument.ENABLED else cur
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the block in one explicit transaction, committed on success and rolled back on error.
+        Joins the open implicit transaction if writes are already pending.
+        """
+        if not self.conn.in_transaction:
+            self.cur.execute("BEGIN")
+        try:
+            yield self
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
 
     def upsert_course(self, course):
-        self.cur.execute("""
-            INSERT OR IGNORE INTO course (course_id, name, courseNumber, thumbnail, semester)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
+        self.upsert_courses([course])
+
+    def upsert_courses(self, courses):
+        # Existing courses are kept as first written, only a missing courseYear is filled in
+        self.cur.executemany("""
+            INSERT INTO course (course_id, name, courseNumber, thumbnail, semester, courseYear)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(course_id) DO UPDATE SET
+                courseYear=COALESCE(course.courseYear, excluded.courseYear);
+        """, ((
             course["courseID"],
             course["title"],
             course["courseNumber"],
             course["thumbnail"],
-            course["semester"]
-        ))
+            course["semester"],
+            course.get("courseYear")
+        ) for course in courses))
 
     def upsert_assignment(self, assignment):
-        self.cur.execute("""
-            INSERT INTO assignment (assignment_id, course_id, due_date, name, type)
-            VALUES (?, ?, ?, ?, ?)
+        self.upsert_assignments([assignment])
+
+    def upsert_assignments(self, assignments):
+        self.cur.executemany("""
+            INSERT INTO assignment (assignment_id, course_id, due_date, name, type, due_epoch)
+            VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(assignment_id) DO UPDATE SET
                 course_id=excluded.course_id,
                 due_date=excluded.due_date,
                 name=excluded.name,
-                type=excluded.type;
-        """, (
+                type=excluded.type,
+                due_epoch=excluded.due_epoch;
+        """, ((
             assignment["id"],
             assignment["courseID"],
             assignment["dueDate"],
             assignment["title"],
-            assignment["type"]
-        ))
+            assignment["type"],
+            to_epoch(assignment["dueDate"])
+        ) for assignment in assignments))
+
+    def backfill_due_epoch(self):
+        """Fills assignment.due_epoch for rows written before the column existed. Returns the row count."""
+        self.cur.execute("SELECT assignment_id, due_date FROM assignment WHERE due_epoch IS NULL AND due_date IS NOT NULL;")
+        rows = [(to_epoch(due_date), assignment_id) for assignment_id, due_date in self.cur.fetchall()]
+        self.cur.executemany("UPDATE assignment SET due_epoch = ? WHERE assignment_id = ?;", rows)
+        return len(rows)
+
+    def backfill_course_year(self):
+        """
+        Fills course.courseYear for rows written before the column existed, from the academic year
+        (August to July, Bangkok time) of the course's latest due date. Returns the row count.
+        """
+        self.cur.execute("""
+            SELECT c.course_id, MAX(a.due_epoch) FROM course c
+            JOIN assignment a ON a.course_id = c.course_id
+            WHERE c.courseYear IS NULL AND a.due_epoch IS NOT NULL
+            GROUP BY c.course_id;
+        """)
+        rows = []
+        for course_id, due_epoch in self.cur.fetchall():
+            due = time.gmtime(due_epoch + 7 * 3600)
+            rows.append((str(due.tm_year if due.tm_mon >= 8 else due.tm_year - 1), course_id))
+        self.cur.executemany("UPDATE course SET courseYear = ? WHERE course_id = ?;", rows)
+        return len(rows)
 
     def upsert_user(self, data):
         self.cur.execute("""
@@ -54,17 +249,202 @@ class DBManager:
         self.cur.execute("""
             DELETE FROM user WHERE user_id = ?;
         """, (user_id,))
+        # Cached tokens/cookies give the same access as the password, drop them with the user
+        self.delete_auth_session(user_id)
         
     def is_line(self, line_uid):
         self.cur.execute("SELECT 1 FROM user WHERE Line_uid = ?;", (line_uid,))
         return self.cur.fetchone() is not None
 
-    def assign_to_users(self,user_id, assignment_id,status):
+    def fetch_auth_session(self, user_id):
+        self.cur.execute("""
+            SELECT auth_token, refresh_token, expires_at, cookies
+            FROM auth_session WHERE user_id = ?;
+        """, (user_id,))
+        row = self.cur.fetchone()
+        if row is None:
+            return None
+        auth_token, refresh_token, expires_at, cookies = row
+        try:
+            return {
+                "auth_token": session_cipher.decrypt(auth_token),
+                "refresh_token": session_cipher.decrypt(refresh_token),
+                "expires_at": expires_at,
+                "cookies": session_cipher.decrypt(cookies)
+            }
+        except ValueError:
+            # Written with a replaced key, the scraper logs in again
+            return None
+
+    def upsert_auth_session(self, user_id, auth_session):
         self.cur.execute("""
+            INSERT INTO auth_session (user_id, auth_token, refresh_token, expires_at, cookies, updated_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now', '+7 hours'))
+            ON CONFLICT(user_id) DO UPDATE SET
+                auth_token=excluded.auth_token,
+                refresh_token=excluded.refresh_token,
+                expires_at=excluded.expires_at,
+                cookies=excluded.cookies,
+                updated_at=excluded.updated_at
+        """, (
+            user_id,
+            session_cipher.encrypt(auth_session["auth_token"]),
+            session_cipher.encrypt(auth_session["refresh_token"]),
+            auth_session["expires_at"],
+            session_cipher.encrypt(auth_session["cookies"])
+        ))
+
+    def delete_auth_session(self, user_id):
+        self.cur.execute("DELETE FROM auth_session WHERE user_id = ?;", (user_id,))
+
+    def assign_to_users(self,user_id, assignment_id,status):
+        self.assign_to_users_bulk([(user_id, assignment_id, status)])
+
+    def assign_to_users_bulk(self, rows):
+        """rows: (user_id, assignment_id, status) tuples."""
+        self.cur.executemany("""
             INSERT OR IGNORE INTO user_assignments (user_id, assignment_id, notify_3d, notify_1d,status)
             VALUES (?, ?, FALSE, FALSE,?);
-        """, (user_id, assignment_id,status))
-        
+        """, rows)
+
+    def update_assignment_status(self, user_id, assignment_id, status):
+        self.update_assignment_statuses([(user_id, assignment_id, status)])
+
+    def update_assignment_statuses(self, rows):
+        """rows: (user_id, assignment_id, status) tuples."""
+        self.cur.executemany("""
+            UPDATE user_assignments SET status = ?
+            WHERE user_id = ? AND assignment_id = ?;
+        """, ((status, user_id, assignment_id) for user_id, assignment_id, status in rows))
+
+    def schedule_notifications(self, rows):
+        """
+        Adds the 3d/1d reminders of new (user_id, assignment_id) links, fired relative to the
+        stored due_epoch. Existing reminders are left alone, see reschedule_notifications.
+        """
+        self.cur.executemany(f"""
+            INSERT INTO notification_schedule (user_id, assignment_id, kind, fire_at_epoch)
+            SELECT ?, a.assignment_id, k.kind, a.due_epoch - k.lead
+            FROM assignment a, ({NOTIFY_KINDS_SQL}) k
+            WHERE a.assignment_id = ? AND a.due_epoch IS NOT NULL
+            ON CONFLICT(user_id, assignment_id, kind) DO NOTHING;
+        """, rows)
+
+    def reschedule_notifications(self, assignments):
+        """
+        Moves every linked user's reminders of assignments whose due date changed and makes them
+        pending again, recreating the ones already expired.
+
+        Args:
+            assignments (iterable): Assignment dicts from query_assignment.
+        """
+        self.cur.executemany(f"""
+            INSERT INTO notification_schedule (user_id, assignment_id, kind, fire_at_epoch)
+            SELECT ua.user_id, ua.assignment_id, k.kind, :due - k.lead
+            FROM user_assignments ua, ({NOTIFY_KINDS_SQL}) k
+            WHERE ua.assignment_id = :id AND :due IS NOT NULL
+            ON CONFLICT(user_id, assignment_id, kind) DO UPDATE SET
+                fire_at_epoch = excluded.fire_at_epoch,
+                sent_at = NULL
+            WHERE fire_at_epoch IS NOT excluded.fire_at_epoch;
+        """, ({"id": a["id"], "due": to_epoch(a["dueDate"])} for a in assignments))
+
+    def backfill_notification_schedule(self, now=None):
+        """Schedules the not yet due links that predate notification_schedule, sent ones as already sent."""
+        now = int(now or time.time())
+        self.cur.execute(f"""
+            INSERT OR IGNORE INTO notification_schedule (user_id, assignment_id, kind, fire_at_epoch, sent_at)
+            SELECT 
+                ua.user_id, ua.assignment_id, k.kind, a.due_epoch - k.lead,
+                CASE WHEN (k.kind = '3d' AND ua.notify_3d) OR (k.kind = '1d' AND ua.notify_1d) THEN :now END
+            FROM user_assignments ua
+            JOIN assignment a ON ua.assignment_id = a.assignment_id, ({NOTIFY_KINDS_SQL}) k
+            WHERE a.due_epoch > :now;
+        """, {"now": now})
+
+    def fetch_course_hashes(self, user_id):
+        """Returns {course_id: content_hash} of every course synced for the user."""
+        self.cur.execute("""
+            SELECT course_id, content_hash FROM course_sync WHERE user_id = ?;
+        """, (user_id,))
+        return dict(self.cur.fetchall())
+
+    def upsert_course_hashes(self, rows):
+        """rows: (user_id, course_id, content_hash) tuples."""
+        self.cur.executemany("""
+            INSERT INTO course_sync (user_id, course_id, content_hash)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, course_id) DO UPDATE SET
+                content_hash=excluded.content_hash;
+        """, rows)
+
+    def fetch_course_assignment_state(self, user_id, course_ids):
+        """
+        Returns {assignment_id: (course_id, due_date, name, type, status)} for the stored assignments
+        of `course_ids`, status is None when the user is not linked to the assignment yet.
+        """
+        course_ids = list(course_ids)
+        self.cur.execute(f"""
+            SELECT a.assignment_id, a.course_id, a.due_date, a.name, a.type, ua.status
+            FROM assignment a
+            LEFT JOIN user_assignments ua
+                ON ua.assignment_id = a.assignment_id AND ua.user_id = ?
+            WHERE a.course_id IN ({",".join("?" * len(course_ids))});
+        """, (user_id, *course_ids))
+        return {row[0]: row[1:] for row in self.cur.fetchall()}
+
+    def start_sync_run(self, user_ids=None):
+        """Creates a sync run with one pending job per user (every user when None) and returns its run_id."""
+        self.cur.execute("INSERT INTO sync_run DEFAULT VALUES;")
+        run_id = self.cur.lastrowid
+        if user_ids is None:
+            self.cur.execute("INSERT INTO sync_job (run_id, user_id) SELECT ?, user_id FROM user;", (run_id,))
+        else:
+            self.cur.executemany("""
+                INSERT INTO sync_job (run_id, user_id) VALUES (?, ?);
+            """, [(run_id, user_id) for user_id in user_ids])
+        return run_id
+
+    def fetch_resumable_run(self):
+        """
+        Returns the latest sync run if it still has unfinished jobs, or None.
+        Older runs are never resumed, a newer run has already synced their users.
+        """
+        self.cur.execute(f"""
+            SELECT r.run_id FROM (SELECT MAX(run_id) AS run_id FROM sync_run) r
+            WHERE EXISTS (SELECT 1 FROM sync_job WHERE run_id = r.run_id AND {UNFINISHED_JOB_SQL});
+        """)
+        row = self.cur.fetchone()
+        return row[0] if row else None
+
+    def fetch_unfinished_users(self, run_id):
+        """
+        UserRow of the run's users still pending, or failed fewer than MAX_JOB_ATTEMPTS times.
+        Fetched up front, the sync updates these sync_job rows while it runs.
+        """
+        self.cur.execute(f"""
+            SELECT u.user_id, u.cname, u.cpass FROM sync_job j
+            JOIN user u ON u.user_id = j.user_id
+            WHERE j.run_id = ? AND {UNFINISHED_JOB_SQL};
+        """, (run_id,))
+        return [UserRow._make(row) for row in self.cur.fetchall()]
+
+    def set_job_status(self, run_id, user_id, status, error=None):
+        """Records the outcome ('done' or 'failed') of one attempt at a job."""
+        self.cur.execute("""
+            UPDATE sync_job
+            SET status = ?,
+                error = ?,
+                attempts = attempts + 1,
+                updated_at = datetime('now', '+7 hours')
+            WHERE run_id = ? AND user_id = ?;
+        """, (status, error, run_id, user_id))
+
+    def finish_sync_run(self, run_id):
+        self.cur.execute("""
+            UPDATE sync_run SET finished_at = datetime('now', '+7 hours') WHERE run_id = ?;
+        """, (run_id,))
+
     def count_all_user(self):
         self.cur.execute("SELECT COUNT(*) FROM user;")
         count = self.cur.fetchone()[0]
@@ -107,64 +487,75 @@ class DBManager:
         self.cur.execute(query, (user_id,))
         return self.cur.fetchall()
     
-    def fetch_open_assm_by_id(self, user_id):
-        query = """
-            SELECT 
-                a.assignment_id,
-                a.name AS assignment_name,
-                a.due_date,
-                a.type AS assignment_type,
-                ua.status,
-                c.course_id,
-                c.name AS course_name,
-                c.courseNumber,
-                c.thumbnail,
-                c.semester
-            FROM user_assignments ua
-            JOIN assignment a ON ua.assignment_id = a.assignment_id
-            JOIN course c ON a.course_id = c.course_id
-            WHERE 
-                datetime(a.due_date) >= datetime('now', '+7 hours')
-                AND datetime(a.due_date) <= datetime('now', '+7 days', '+7 hours')
-                AND ua.user_id = ?;
+    def iter_rows(self, query, params=(), row_type=None, batch_size=BATCH_SIZE):
         """
-        self.cur.execute(query,(user_id,))
-        return self.cur.fetchall()
-    
-    def fetch_3d_notify_user(self):
-        query = """
-            SELECT 
-                ua.user_id,
-                u.Line_uid,
-                a.assignment_id
-            FROM user_assignments ua
-            JOIN assignment a ON ua.assignment_id = a.assignment_id
-            JOIN user u ON ua.user_id = u.user_id
-            WHERE 
-                datetime(a.due_date) >= datetime('now','+1 days', '+7 hours')
-                AND datetime(a.due_date) <= datetime('now', '+3 days', '+7 hours')
-                AND (ua.notify_3d = FALSE);
+        Streams the rows of `query` in fetchmany batches on a dedicated cursor,
+        so memory stays bounded by `batch_size` whatever the table size.
+
+        Args:
+            row_type (namedtuple | None): Type each row is built into, plain tuples when None.
         """
-        self.cur.execute(query)
-        return self.cur.fetchall()
-    
-    def fetch_1d_notify_user(self):
-        query = """
-            SELECT 
-                ua.user_id,
-                u.Line_uid,
-                a.assignment_id
-            FROM user_assignments ua
-            JOIN assignment a ON ua.assignment_id = a.assignment_id
-            JOIN user u ON ua.user_id = u.user_id
-            WHERE 
-                datetime(a.due_date) >= datetime('now', '+7 hours')
-                AND datetime(a.due_date) <= datetime('now', '+1 days', '+7 hours')
-                AND (ua.notify_1d = FALSE);
+        # Resolved here, the generator body only runs once the caller has returned
+        name = instrument.caller_name() if instrument.ENABLED else None
+        return self._stream(query, params, row_type, batch_size, name)
+
+    def _stream(self, query, params, row_type, batch_size, name):
+        cur = self._cursor(name)
+        try:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield row_type._make(row) if row_type else row
+        finally:
+            cur.close()
+
+    def iter_users(self, batch_size=BATCH_SIZE):
+        """UserRow stream of every user, the sync writes other tables while it reads this one."""
+        return self.iter_rows("SELECT user_id, cname, cpass FROM user;", (), UserRow, batch_size)
+
+    @staticmethod
+    def _reminder_windows(now):
+        # A reminder is live from fire_at_epoch until the next one takes over (3d) or the due date (1d)
+        return {"now": now, "live_1d": now - NOTIFY_LEADS["1d"], "live_3d": now - (NOTIFY_LEADS["3d"] - NOTIFY_LEADS["1d"])}
+
+    def iter_scheduled_rows(self, now=None, batch_size=BATCH_SIZE):
+        """NotifyRow stream of the users with a live reminder, see FETCH_SCHEDULED_ROWS_SQL."""
+        params = self._reminder_windows(int(now or time.time()))
+        params["d7"] = params["now"] + 7 * DAY
+        return self.iter_rows(FETCH_SCHEDULED_ROWS_SQL, params, NotifyRow, batch_size)
+
+    def mark_notifications_sent(self, rows, now=None):
         """
-        self.cur.execute(query)
-        return self.cur.fetchall()
-    
+        Pops the reminders behind update_notify_bulk rows off the pending schedule.
+
+        Args:
+            rows (iterable): (user_id, assignment_id, notify_3d, notify_1d) tuples, as for update_notify_bulk.
+
+        Returns:
+            int: Number of reminders marked sent.
+        """
+        now = int(now or time.time())
+        self.cur.executemany("""
+            UPDATE notification_schedule
+            SET sent_at = ?
+            WHERE user_id = ? AND assignment_id = ? AND sent_at IS NULL
+                AND ((kind = '3d' AND ?) OR (kind = '1d' AND ?));
+        """, ((now, user_id, assignment_id, notify_3d, notify_1d) for user_id, assignment_id, notify_3d, notify_1d in rows))
+        return self.cur.rowcount
+
+    def expire_notifications(self, now=None):
+        """Drops pending reminders whose window closed before they were sent."""
+        self.cur.execute("""
+            DELETE FROM notification_schedule
+            WHERE sent_at IS NULL
+                AND fire_at_epoch < :live_1d
+                AND fire_at_epoch < (CASE kind WHEN '3d' THEN :live_3d ELSE :live_1d END);
+        """, self._reminder_windows(int(now or time.time())))
+        return self.cur.rowcount
+
     def Update_notify(self, user_id, assignment_id, notify_3d, notify_1d):
         self.cur.execute("""
             UPDATE user_assignments
@@ -173,12 +564,129 @@ class DBManager:
         """, (notify_3d, notify_1d, user_id, assignment_id))
         return self.cur.rowcount > 0
 
-    
+    def update_notify_bulk(self, rows):
+        """
+        Update_notify for many pairs in one executemany, applied in order.
+
+        Args:
+            rows (iterable): (user_id, assignment_id, notify_3d, notify_1d) tuples.
+
+        Returns:
+            int: Number of user_assignments rows updated.
+        """
+        self.cur.executemany("""
+            UPDATE user_assignments
+            SET notify_3d = ?, notify_1d = ?
+            WHERE user_id = ? AND assignment_id = ?;
+        """, ((notify_3d, notify_1d, user_id, assignment_id) for user_id, assignment_id, notify_3d, notify_1d in rows))
+        return self.cur.rowcount
+
+    def attach_archive(self, archive_path=ARCHIVE_PATH):
+        """Attaches the archive DB file as schema "archive", creating its tables on first use."""
+        if self._archive_attached:
+            return
+        self.cur.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+        self._archive_attached = True
+        for statement in ARCHIVE_SCHEMA:
+            self.cur.execute(statement)
+        # Migration: archives created before courseYear was stored
+        if "courseYear" not in [row[1] for row in self.cur.execute("PRAGMA archive.table_info(course)")]:
+            self.cur.execute("ALTER TABLE archive.course ADD COLUMN courseYear TEXT")
+        self.conn.commit()
+
+    def archive_finished_courses(self, current_semester, academic_year, now=None):
+        """
+        Moves courses of other terms whose assignments are all past due, with their
+        assignments and user links, from the hot tables into the archive DB.
+        Call inside db.transaction() after attach_archive().
+
+        Args:
+            current_semester (int | str): Semester number from get_semester_info.
+            academic_year (int | str): Academic year from get_semester_info, courses of this
+                                       semester and year are never archived. Courses without
+                                       a courseYear are kept whenever their semester matches.
+            now (int | None): Epoch seconds the due dates are compared with, time.time() when None.
+
+        Returns:
+            dict: Rows moved {"courses": int, "assignments": int, "user_assignments": int}.
+        """
+        now = int(now or time.time())
+        self.cur.execute("DROP TABLE IF EXISTS temp.archive_course_ids")
+        self.cur.execute("""
+            CREATE TEMP TABLE archive_course_ids AS
+            SELECT c.course_id FROM course c
+            WHERE 
+                NOT (c.semester IS :semester AND (c.courseYear IS NULL OR c.courseYear IS :year))
+                AND NOT EXISTS (
+                    SELECT 1 FROM assignment a
+                    WHERE a.course_id = c.course_id AND a.due_epoch >= :now
+                );
+        """, {"semester": str(current_semester), "year": str(academic_year), "now": now})
+        # Copy first, rows already archived by an interrupted run are replaced
+        self.cur.execute("""
+            INSERT OR REPLACE INTO archive.course (course_id, name, type, courseNumber, thumbnail, semester, courseYear)
+            SELECT course_id, name, type, courseNumber, thumbnail, semester, courseYear FROM course
+            WHERE course_id IN temp.archive_course_ids;
+        """)
+        self.cur.execute("""
+            INSERT OR REPLACE INTO archive.assignment
+            SELECT assignment_id, course_id, due_date, name, type, due_epoch FROM assignment
+            WHERE course_id IN temp.archive_course_ids;
+        """)
+        self.cur.execute("""
+            INSERT OR REPLACE INTO archive.user_assignments
+            SELECT ua.user_id, ua.assignment_id, ua.notify_1d, ua.notify_3d, ua.status
+            FROM user_assignments ua
+            JOIN assignment a ON ua.assignment_id = a.assignment_id
+            WHERE a.course_id IN temp.archive_course_ids;
+        """)
+        counts = {}
+        # Both subqueries read the assignment rows, delete from them before the assignments go
+        self.cur.execute("""
+            DELETE FROM notification_schedule WHERE assignment_id IN (
+                SELECT assignment_id FROM assignment WHERE course_id IN temp.archive_course_ids
+            );
+        """)
+        self.cur.execute("""
+            DELETE FROM user_assignments WHERE assignment_id IN (
+                SELECT assignment_id FROM assignment WHERE course_id IN temp.archive_course_ids
+            );
+        """)
+        counts["user_assignments"] = self.cur.rowcount
+        self.cur.execute("DELETE FROM assignment WHERE course_id IN temp.archive_course_ids;")
+        counts["assignments"] = self.cur.rowcount
+        self.cur.execute("DELETE FROM course_sync WHERE course_id IN temp.archive_course_ids;")
+        self.cur.execute("DELETE FROM course WHERE course_id IN temp.archive_course_ids;")
+        counts["courses"] = self.cur.rowcount
+        self.cur.execute("DROP TABLE temp.archive_course_ids")
+        return counts
+
+    def fetch_history(self, user_id, semester=None):
+        """
+        Archived assignments of one user, latest due first, as OpenAssignmentRow.
+
+        Args:
+            semester (int | str | None): Only this semester's courses, every archived one when None.
+        """
+        self.attach_archive()
+        params = {"user_id": user_id, "semester": None if semester is None else str(semester)}
+        return [OpenAssignmentRow._make(row) for row in self.cur.execute(HISTORY_SQL, params).fetchall()]
+
     def commit(self):
         self.conn.commit()
 
     def close(self):
-        self.conn.close()
+        # Safe to call twice, a second release would put the connection in the pool twice
+        if self.conn is None:
+            return
+        if self._archive_attached:
+            # Pooled connections are reused, do not hand them out with the archive attached
+            self.conn.rollback()
+            self.cur.execute("DETACH DATABASE archive")
+            self._archive_attached = False
+        self.cur.close()
+        self._pool.release(self.conn)
+        self.conn = self.cur = None
         
 if __name__ == "__main__":
     db = DBManager()
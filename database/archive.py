@@ -0,0 +1,55 @@
+import argparse
+import json
+
+from database.DB_manager import DBManager, ARCHIVE_PATH
+from Utility.logger import info, error
+
+
+def archive_past_semesters(db, current_semester, academic_year, now=None, archive_path=ARCHIVE_PATH):
+    """
+    Moves every finished course (other semester or year, all due dates past) into the archive DB,
+    so the tables the notification queries scan only hold the current term.
+
+    Returns:
+        dict: Rows moved {"courses": int, "assignments": int, "user_assignments": int}.
+    """
+    db.attach_archive(archive_path)
+    with db.transaction():
+        return db.archive_finished_courses(current_semester, academic_year, now)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive past-semester courses and read archived history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="move finished past-semester courses into the archive DB")
+    run.add_argument("--semester", type=int, help="semester kept in the hot tables (default: current)")
+    run.add_argument("--year", type=int, help="academic year of that semester (default: current)")
+    run.add_argument("--archive", default=ARCHIVE_PATH)
+
+    history = sub.add_parser("history", help="print a user's archived assignments")
+    history.add_argument("user_id")
+    history.add_argument("--semester", type=int)
+
+    args = parser.parse_args()
+    db = DBManager()
+    try:
+        if args.command == "run":
+            semester, year = args.semester, args.year
+            if semester is None or year is None:
+                from scraper.update_assm import get_semester_info
+                current_semester, current_year = get_semester_info()
+                semester = current_semester if semester is None else semester
+                year = current_year if year is None else year
+            counts = archive_past_semesters(db, semester, year, archive_path=args.archive)
+            print(f"Archived {counts['courses']} courses, {counts['assignments']} assignments, "
+                  f"{counts['user_assignments']} user links")
+            info("archive", "Archived past-semester data", json.dumps(counts))
+        else:
+            for row in db.fetch_history(args.user_id, args.semester):
+                print(f"{row.semester:>2} {row.courseNumber or '':<10} {row.due_date or '':<26} {row.status or '':<10} {row.assignment_name}")
+    except Exception as e:
+        error("archive", f"Archive {args.command} failed: {e}")
+        raise
+    finally:
+        db.close()
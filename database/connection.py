@@ -0,0 +1,67 @@
+import os
+import queue
+import sqlite3
+import threading
+
+# Applied to every new connection. WAL lets the webhook server read while a cron job writes,
+# busy_timeout waits on a held lock instead of failing with "database is locked".
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA synchronous=NORMAL",     # safe with WAL, fsync only at checkpoints
+    "PRAGMA cache_size=-16000",      # 16 MB page cache
+    "PRAGMA temp_store=MEMORY",
+)
+POOL_SIZE = 8
+
+
+class ConnectionPool:
+    """
+    A small pool of sqlite3 connections to one database file.
+    Connections are created with check_same_thread=False so a released connection can be
+    handed to another thread, but each is only ever used by one thread at a time.
+    """
+    def __init__(self, db_name, size=POOL_SIZE):
+        self.db_name = db_name
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, timeout=5, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        # Uncommitted work is discarded, as closing a connection used to do
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name):
+    """Returns the process-wide pool for `db_name` (a forked child gets its own pools)."""
+    key = (os.getpid(), db_name)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(db_name)
+        return _pools[key]
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+import threading
+import time
+from Utility.logger import info
+
+# Off by default: DBManager then uses plain sqlite3 cursors and pays nothing
+ENABLED = os.getenv("DB_STATS", "0") == "1"
+SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY", "0.1"))
+MAX_SAMPLES = 10000     # latency samples kept per query for the percentiles
+
+
+class QueryStats:
+    """Per named query: calls, total/p99 latency, rows returned and the plan of slow statements."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._queries = {}
+
+    def record(self, name, elapsed, rows, plan=None):
+        with self._lock:
+            entry = self._queries.setdefault(name, {"calls": 0, "total": 0.0, "rows": 0, "samples": [], "plan": None})
+            entry["calls"] += 1
+            entry["total"] += elapsed
+            entry["rows"] += rows
+            samples = entry["samples"]
+            if len(samples) < MAX_SAMPLES:
+                samples.append(elapsed)
+            else:
+                samples[entry["calls"] % MAX_SAMPLES] = elapsed
+            if plan is not None:
+                entry["plan"] = plan
+
+    def needs_plan(self, name):
+        with self._lock:
+            entry = self._queries.get(name)
+            return entry is None or entry["plan"] is None
+
+    def snapshot(self):
+        """Returns {name: {"calls", "total_ms", "p99_ms", "rows", "plan"}}, slowest total first."""
+        with self._lock:
+            result = {}
+            for name, entry in self._queries.items():
+                samples = sorted(entry["samples"])
+                p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0
+                result[name] = {
+                    "calls": entry["calls"],
+                    "total_ms": round(entry["total"] * 1000, 3),
+                    "p99_ms": round(p99 * 1000, 3),
+                    "rows": entry["rows"],
+                    "plan": entry["plan"],
+                }
+        return dict(sorted(result.items(), key=lambda item: -item[1]["total_ms"]))
+
+query_stats = QueryStats()
+
+
+def caller_name(depth=2):
+    """Name of the DBManager method that issued the statement."""
+    return sys._getframe(depth).f_code.co_name
+
+
+class InstrumentedCursor:
+    """
+    Wraps a sqlite3 cursor and reports every statement to `query_stats` under the name of
+    the method that ran it. Time spent in the fetch calls counts towards the same statement.
+    """
+    def __init__(self, cursor, name=None, stats=query_stats):
+        self._cursor = cursor
+        self._name = name   # fixed name for cursors dedicated to one query (iter_rows)
+        self._stats = stats
+        self._call = None   # [name, sql, params, elapsed, rows] of the statement being read
+
+    def __getattr__(self, attr):
+        return getattr(self._cursor, attr)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _finish(self):
+        if self._call is None:
+            return
+        name, sql, params, elapsed, rows = self._call
+        self._call = None
+        plan = None
+        if elapsed >= SLOW_QUERY_SECONDS and params is not None and self._stats.needs_plan(name):
+            try:
+                plan = [row[3] for row in self._cursor.connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+            except Exception:
+                plan = None
+        self._stats.record(name, elapsed, rows, plan)
+
+    def _run(self, method, sql, params, name):
+        self._finish()
+        start = time.perf_counter()
+        method(sql, params)
+        elapsed = time.perf_counter() - start
+        rows = self._cursor.rowcount if self._cursor.rowcount > 0 else 0
+        self._call = [name, sql, params if method == self._cursor.execute else None, elapsed, rows]
+        return self
+
+    def execute(self, sql, params=(), name=None):
+        return self._run(self._cursor.execute, sql, params, name or self._name or caller_name())
+
+    def executemany(self, sql, seq_of_params, name=None):
+        return self._run(self._cursor.executemany, sql, seq_of_params, name or self._name or caller_name())
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._call is not None:
+            self._call[3] += time.perf_counter() - start
+            self._call[4] += len(result) if isinstance(result, list) else int(result is not None)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, size):
+        result = self._fetch(self._cursor.fetchmany, size)
+        if not result:
+            self._finish()
+        return result
+
+    def fetchall(self):
+        result = self._fetch(self._cursor.fetchall)
+        self._finish()
+        return result
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+
+def set_enabled(enabled=True):
+    """Turn instrumentation on or off for DBManager instances created afterwards."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def dump(source):
+    """Print the per-query table and log the snapshot under `source`, no-op when disabled."""
+    if not ENABLED:
+        return
+    snapshot = query_stats.snapshot()
+    print(f"{'query':<32} {'calls':>7} {'total ms':>10} {'p99 ms':>9} {'rows':>8}")
+    for name, entry in snapshot.items():
+        print(f"{name:<32} {entry['calls']:>7} {entry['total_ms']:>10.1f} {entry['p99_ms']:>9.2f} {entry['rows']:>8}")
+        if entry["plan"]:
+            for line in entry["plan"]:
+                print(f"    {line}")
+    info(source, "Query stats", json.dumps(snapshot))
@@ -0,0 +1,171 @@
+import os
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.v3.messaging import ApiClient, ApiException, Configuration, MessagingApi
+from linebot.v3.messaging.models import MulticastRequest, PushMessageRequest
+
+# Local stand-in (test/mock_line.py) or the real API
+LINE_API_URL = os.getenv("LINE_API_URL", "https://api.line.me")
+
+PUSH_WORKERS = 8
+PUSH_RATE = float(os.getenv("LINE_PUSH_RATE", "100"))   # requests per second across all workers
+MESSAGES_PER_PUSH = 5       # LINE accepts at most 5 messages per request
+MULTICAST_LIMIT = 500       # and at most 500 recipients per multicast
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5          # seconds, doubled per retry when the response has no Retry-After
+
+# One per push/multicast submission: ok only when every batch of messages was accepted.
+# user_id is the list of recipients for a multicast.
+PushResult = namedtuple("PushResult", "user_id ok pushes retries latency error")
+
+
+class TokenBucket:
+    """Blocking token bucket shared by the push workers."""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds every worker back for at least `seconds`, used when LINE answers 429."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._updated) * self.rate, -seconds * self.rate)
+            self._updated = now
+
+
+def _retry_after(e: ApiException):
+    """Seconds from the Retry-After header of a 429/5xx response, None when absent."""
+    value = (e.headers or {}).get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class PushDispatcher:
+    """
+    Sends LINE push messages from a worker pool over one long-lived ApiClient.
+    Every request takes a token from a shared bucket; 429 and 5xx responses are retried with
+    the same X-Line-Retry-Key, after Retry-After or an exponential backoff.
+
+    Use as a context manager, submit() and submit_multicast() return a Future of PushResult.
+    """
+    def __init__(self, access_token, workers=PUSH_WORKERS, rate=PUSH_RATE, max_retries=MAX_RETRIES, base_url=LINE_API_URL):
+        configuration = Configuration(access_token=access_token)
+        configuration.connection_pool_maxsize = workers
+        self._client = ApiClient(configuration)
+        self._api = MessagingApi(self._client)
+        self._api.line_base_path = base_url
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="line-push")
+        self._bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self._stats_lock = threading.Lock()
+        self._latencies = []
+        self._failed = 0
+        self._retries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._client.close()
+
+    def submit(self, user_id, messages):
+        """Queues the user's messages, sent in requests of MESSAGES_PER_PUSH."""
+        return self._executor.submit(self._push_user, user_id, messages)
+
+    def submit_multicast(self, user_ids, messages):
+        """Queues the same messages for up to MULTICAST_LIMIT users, sent in requests of MESSAGES_PER_PUSH."""
+        if len(user_ids) > MULTICAST_LIMIT:
+            raise ValueError(f"multicast to {len(user_ids)} users, LINE accepts at most {MULTICAST_LIMIT}")
+        return self._executor.submit(self._push_user, list(user_ids), messages)
+
+    def _push_user(self, user_id, messages):
+        pushes = retries = 0
+        start = time.perf_counter()
+        try:
+            for i in range(0, len(messages), MESSAGES_PER_PUSH):
+                batch = messages[i:i + MESSAGES_PER_PUSH]
+                if isinstance(user_id, list):
+                    send, request = self._api.multicast, MulticastRequest(to=user_id, messages=batch)
+                else:
+                    send, request = self._api.push_message, PushMessageRequest(to=user_id, messages=batch)
+                retries += self._send(lambda key: send(request, x_line_retry_key=key))
+                pushes += 1
+        except Exception as e:
+            with self._stats_lock:
+                self._failed += 1
+            return PushResult(user_id, False, pushes, retries, time.perf_counter() - start, _describe(e))
+        return PushResult(user_id, True, pushes, retries, time.perf_counter() - start, None)
+
+    def _send(self, call):
+        """
+        Runs call(retry_key) under the rate limit, retrying 429/5xx. Returns the number of retries.
+        A 409 on a retry means LINE already accepted the request with this key.
+        """
+        retry_key = str(uuid.uuid4())
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            start = time.perf_counter()
+            try:
+                call(retry_key)
+            except ApiException as e:
+                if e.status == 409 and attempt > 0:
+                    break
+                if (e.status != 429 and (e.status or 0) < 500) or attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = BACKOFF_BASE * 2 ** attempt * (1 + random.random() / 2)
+                if e.status == 429:
+                    self._bucket.pause(delay)
+                with self._stats_lock:
+                    self._retries += 1
+                time.sleep(delay)
+                continue
+            break
+        with self._stats_lock:
+            self._latencies.append(time.perf_counter() - start)
+        return attempt
+
+    def stats(self):
+        """Request count, failed users, retries and p50/p99 request latency."""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            failed, retries = self._failed, self._retries
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1) if latencies else 0.0
+        return {"requests": len(latencies), "failed_users": failed, "retries": retries,
+                "p50_ms": percentile(0.5), "p99_ms": percentile(0.99)}
+
+
+def _describe(e):
+    if isinstance(e, ApiException):
+        body = e.body.decode("utf-8", "replace") if isinstance(e.body, bytes) else e.body
+        return f"HTTP {e.status} {e.reason}: {body}"
+    return f"{type(e).__name__}: {e}"
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+BODY_TEMPLATE = "flex_body_template.json"
+HEADER_TEMPLATE = "flex_header_template.json"
+
+# Same <KEY> syntax as Utility.utility.replace_placeholders
+SLOT_PATTERN = re.compile(r'<([A-Z0-9_]+)>')
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def _compile(node):
+    """
+    Turns a parsed JSON node into a render function of the slot values.
+    Dicts keep their constant scalars in one dict that is copied per render, so only
+    the slots and nested containers cost Python work.
+    """
+    if isinstance(node, dict):
+        consts, slots, children = {}, [], []
+        for key, value in node.items():
+            if isinstance(value, (dict, list)):
+                children.append((key, _compile(value)))
+            elif isinstance(value, str) and SLOT_PATTERN.search(value):
+                slots.append((key, _compile_str(value)))
+            else:
+                consts[key] = value
+
+        def render_dict(values):
+            out = consts.copy()
+            for key, fill in slots:
+                out[key] = fill(values)
+            for key, render in children:
+                out[key] = render(values)
+            return out
+        return render_dict
+
+    if isinstance(node, list):
+        items = [_compile(item) for item in node]
+        return lambda values: [render(values) for render in items]
+
+    if isinstance(node, str) and SLOT_PATTERN.search(node):
+        return _compile_str(node)
+    return lambda values: node
+
+
+def _compile_str(text):
+    """Render function for a string holding <KEY> slots, unknown keys are kept as written."""
+    match = SLOT_PATTERN.fullmatch(text)
+    if match:
+        name = match.group(1)
+        return lambda values: values.get(name, text)
+    # Alternating literal text and slot names: "a <X> b" -> ["a ", "X", " b"]
+    parts = SLOT_PATTERN.split(text)
+
+    def fill(values):
+        return "".join(part if i % 2 == 0 else str(values.get(part, f"<{part}>")) for i, part in enumerate(parts))
+    return fill
+
+
+class FlexTemplate:
+    """
+    A Flex Message JSON template parsed once, rendered by filling its <KEY> slots directly.
+    Values go into the dict tree as Python strings, so quotes or backslashes in a title cannot
+    break the JSON the way text substitution did.
+    """
+    def __init__(self, source: str):
+        self.version = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+        self._render = _compile(json.loads(source))
+
+    @classmethod
+    def from_file(cls, path: str):
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(file.read())
+
+    def render(self, values: dict) -> dict:
+        """
+        Builds a fresh dict tree with every slot filled from `values`.
+
+        Args:
+            values (dict): Slot name (without the brackets) to value.
+
+        Returns:
+            dict: The Flex structure, safe for the caller to modify.
+        """
+        return self._render(values)
+
+
+def get_template(name: str) -> FlexTemplate:
+    """Compiled template `name` from the notifier directory, loaded on first use and kept in memory."""
+    template = _templates.get(name)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(name)
+            if template is None:
+                template = _templates[name] = FlexTemplate.from_file(os.path.join(TEMPLATE_DIR, name))
+    return template
+
+
+def clear_templates():
+    """Forgets the compiled templates, the next get_template reads the files again."""
+    with _templates_lock:
+        _templates.clear()
+
+
+RENDER_CACHE_SIZE = 4096
+
+
+class RenderCache:
+    """
+    LRU cache of rendered Flex parts, meant to live for one notify run so the time-left text
+    baked into the parts never goes stale. Keys are built by the caller and should carry
+    the template version of what they render.
+    """
+    def __init__(self, maxsize=RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        """Cached value for `key`, computed with render() on a miss."""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self._entries[key] = render()
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
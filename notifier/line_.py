@@ -2,19 +2,17 @@ from Utility.utility import replace_placeholders
 import json
 from linebot.v3.messaging import (
     Configuration,
-    ApiClient,
-    MessagingApi,
     ReplyMessageRequest,
     TextMessage,
     FlexMessage,
 )
-from linebot.v3.messaging.models import FlexMessage, FlexContainer, PushMessageRequest
+from linebot.v3.messaging.models import FlexMessage, FlexContainer
 
 
 class LineBot:
     """
     A simple class to encapsulate LINE Messaging API functionality.
-    This class can be extended with more methods as needed.
+    Pushes go through notifier.dispatcher.PushDispatcher, this class builds the messages.
     """
 
     def __init__(self, access_token: str = None, channel_secret: str = None):
@@ -22,28 +20,6 @@ class LineBot:
         channel_secret = channel_secret
         self.configuration = Configuration(access_token=token)
 
-    def push_noti_message(self,user_id: str, flex_messages: list):
-        """
-        Sends a Flex Message to a specific LINE user. This is suitable for proactive notifications.
-
-        Args:
-            user_id (str): The LINE user ID of the recipient.
-            flex_messages (list): A list of FlexMessage objects to send.
-        """
-
-        if flex_messages is None:
-            print("Flex Message is missing. Aborting send.")
-            return
-
-        with ApiClient(self.configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            try:
-                # Use push_message for proactive notifications from your project
-                request = PushMessageRequest(to=user_id, messages=flex_messages)
-                line_bot_api.push_message(request)
-            except Exception as e:
-                print(f"Failed to send Flex Message: {e}")
-
     # --- Flex Message Generation Function ---
     @staticmethod
     def create_notify_message(bubble: dict, alt: str) -> FlexMessage:
@@ -1,80 +1,81 @@
 from database.DB_manager import DBManager
+from database import instrument
 from notifier.line_ import LineBot
+from notifier.dispatcher import PushDispatcher, PUSH_WORKERS, MULTICAST_LIMIT, MESSAGES_PER_PUSH
+from notifier.flex_template import get_template, RenderCache, BODY_TEMPLATE, HEADER_TEMPLATE
 from Utility.utility import *
 from Utility.logger import info, warn, error
 import os
+import json
+import hashlib
+import time
 import pytz
 from datetime import datetime
+from concurrent.futures import wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 
 load_dotenv()
 access_token = os.getenv("CHANNEL_ACCESS_TOKEN")
 channel_secret = os.getenv("CHANNEL_SECRET")
 
-def get_notify_user(db: DBManager) -> dict:
+def iter_notify_users(db: DBManager, now: int = None):
     """
-    Fetches user id for notifications from the database.
+    Streams every user with a fired 1-day or 3-day reminder in notification_schedule together with their open assignments.
+    Rows come from a single query ordered by user and course, so each user is complete (and yielded)
+    as soon as the next user's first row arrives; only one user is held in memory at a time
+    (iter_notify_groups then keeps up to a chunk of rendered users before sending them).
     
     Args:
         db (DBManager): The database manager instance.
+        now (int): Epoch seconds the reminders are due against, time.time() when None.
         
-    Returns:
-        dict: A dictionary containing user IDs and their corresponding assignment data.
+    Yields:
+        tuple[str, dict]: user_id and {"l": Line_uid, "d1": [assignment_id], "d3": [assignment_id], "courses": [course dict]},
+                          where "courses" has the shape used by process_course_data.
     """
-    data = dict()
-    rows_3day = db.fetch_3d_notify_user()
-    for row in rows_3day:
-        user_id,Line_uid, assignment_id = row
-        if user_id not in data:
-            data[user_id] = {"l":Line_uid,"d1": [], "d3": []}
-        data[user_id]["d3"].append(assignment_id)
-    rows_1day = db.fetch_1d_notify_user()
-    for row in rows_1day:
-        user_id, Line_uid, assignment_id = row
-        if user_id not in data:
-            data[user_id] = {"l": Line_uid, "d1": [], "d3": []}
-        data[user_id]["d1"].append(assignment_id)
-
-    return data
-
-def fetch_assignment_data(db: DBManager, uid: str) -> list[dict]:
-    rows = db.fetch_open_assm_by_id(uid)
-
-    courses = {}  # Key: course_id, Value: course dict
-
-    for row in rows:
-        (
-        assignment_id, assignment_name, due_date, a_type, status,
-        course_id, course_name, course_number, thumbnail, semester
-        ) = row
-
-        if course_id not in courses:
-            courses[course_id] = {
-                "courseID": course_id,
-                "title": course_name,
-                "courseNumber": course_number,
-                "thumbnail": thumbnail,
-                "semester": semester,
+    user_id = user = course = None
+    for row in db.iter_scheduled_rows(now):
+        if row.user_id != user_id:
+            if user is not None:
+                yield user_id, user
+            user_id = row.user_id
+            user = {"l": row.Line_uid, "d1": [], "d3": [], "courses": []}
+            course = None
+        if course is None or course["courseID"] != row.course_id:
+            course = {
+                "courseID": row.course_id,
+                "title": row.course_name,
+                "courseNumber": row.courseNumber,
+                "thumbnail": row.thumbnail,
+                "semester": row.semester,
                 "assignments": []
             }
+            user["courses"].append(course)
 
-        courses[course_id]["assignments"].append({
-            "courseID": course_id,
-            "id": assignment_id,
-            "title": assignment_name,
-            "type": a_type,
-            "status": status,
-            "dueDate": due_date
+        course["assignments"].append({
+            "courseID": row.course_id,
+            "id": row.assignment_id,
+            "title": row.assignment_name,
+            "type": row.assignment_type,
+            "status": row.status,
+            "dueDate": row.due_date
         })
+        if row.due_1d:
+            user["d1"].append(row.assignment_id)
+        if row.due_3d:
+            user["d3"].append(row.assignment_id)
+    if user is not None:
+        yield user_id, user
 
-    return list(courses.values())
-
-def process_course_data(course_list: list):
+def process_course_data(course_list: list, current_time: datetime = None, cache: RenderCache = None):
     """
     Processes the raw JSON data, extracts assignment information,
     and generates Flex Messages for each assignment.
-    
+
+    With a run-wide `cache`, assignment bodies and whole course messages are shared between
+    users whose assignments render the same, so the work scales with distinct assignments.
     """
+    current_time = current_time or datetime.now(pytz.timezone('Asia/Bangkok'))
     messages = []
     for course in course_list:
         course_data = {
@@ -87,84 +88,113 @@ def process_course_data(course_list: list):
         if len(course_data["assignments"]) == 0:
             continue
         try:
-            message = create_crouse_flex_bubble(course_data)
-            if message:
-                bubble, alt = message
-                flex_message = LineBot.create_notify_message(bubble, alt)
-                messages.append(flex_message)
+            if cache is None:
+                bubble, alt = create_crouse_flex_bubble(course_data, current_time)
+                messages.append(LineBot.create_notify_message(bubble, alt))
+            else:
+                messages.append(create_course_message_cached(course_data, current_time, cache))
         except Exception as e:
             error("notify_engine",f"Failed to create Flex Message for course: {course_data['title']}. Error: {e}")
 
 
     return messages
 
-def create_assingment_flex_body(assignment_info: dict) -> dict:
+def assignment_render_key(assignment_info: dict, current_time: datetime) -> tuple:
+    """
+    Cache key of an assignment body: (assignment_id, status, time-left bucket, template version).
+    The bucket is the rendered time-left text plus the state it selects, so two keys are
+    equal exactly when the bodies are.
+    """
+    time_left_str, total_seconds_left = calculate_time_left(assignment_info.get('dueDate', ''), current_time)
+    status = assignment_info.get('status', 'UNKNOWN')
+    state = get_assignment_state(status, total_seconds_left)
+    return (assignment_info.get('id'), status, (time_left_str, state), get_template(BODY_TEMPLATE).version)
+
+def create_course_message_cached(course_data: dict, current_time: datetime, cache: RenderCache):
+    """
+    create_crouse_flex_bubble + LineBot.create_notify_message, built from cached assignment bodies
+    and reused as a whole for every user with the same course and assignment keys.
+    """
+    assignments = course_data["assignments"]
+    keys = tuple(assignment_render_key(a, current_time) for a in assignments)
+
+    def render_message():
+        bubble = get_template(HEADER_TEMPLATE).render({"COURSE_TITLE": course_data.get("title", "N/A")})
+        bubble['body']['contents'] = [
+            cache.get_or_render(("body",) + key, lambda a=a: create_assingment_flex_body(a, current_time))
+            for a, key in zip(assignments, keys)
+        ]
+        alt = f"Course: {course_data.get('title', 'N/A')} - Assignments: {len(assignments)}"
+        return LineBot.create_notify_message(bubble, alt)
+
+    message_key = ("course", course_data.get("courseID"), course_data.get("title"), keys, get_template(HEADER_TEMPLATE).version)
+    return cache.get_or_render(message_key, render_message)
+
+# Properties for each assignment state, including text, colors, and font styles
+STATE_PROPERTIES = {
+    "submitted_on_time": {
+        "STATUS_TEXT": "Submitted",
+        "STATUS_BG_COLOR": "#22c55e", # Green
+        "TIME_LEFT_COLOR": "#2d3138", # Dark gray
+        "TIME_LEFT_WEIGHT": "regular",
+        "TIME_LEFT_SIZE": "md"
+    },
+    "submitted_overdue": {
+        "STATUS_TEXT": "Submitted",
+        "STATUS_BG_COLOR": "#22c55e", # Green
+        "TIME_LEFT_COLOR": "#750060", # Purple
+        "TIME_LEFT_WEIGHT": "bold",
+        "TIME_LEFT_SIZE": "lg"
+    },
+    "not_submitted_normal": {
+        "STATUS_TEXT": "Not submitted",
+        "STATUS_BG_COLOR": "#94a3b8", # Light gray/blue
+        "TIME_LEFT_COLOR": "#2d3138", # Dark gray
+        "TIME_LEFT_WEIGHT": "regular",
+        "TIME_LEFT_SIZE": "md"
+    },
+    "not_submitted_warning": {
+        "STATUS_TEXT": "Not submitted",
+        "STATUS_BG_COLOR": "#fab002", # Orange/Yellow
+        "TIME_LEFT_COLOR": "#fab002", # Orange/Yellow
+        "TIME_LEFT_WEIGHT": "bold",
+        "TIME_LEFT_SIZE": "xl"
+    },
+    "not_submitted_critical": {
+        "STATUS_TEXT": "Not submitted",
+        "STATUS_BG_COLOR": "#ef4444", # Red
+        "TIME_LEFT_COLOR": "#ef4444", # Red
+        "TIME_LEFT_WEIGHT": "bold",
+        "TIME_LEFT_SIZE": "3xl"
+    },
+    "not_submitted_overdue": {
+        "STATUS_TEXT": "Not submitted",
+        "STATUS_BG_COLOR": "#574353", # Dark purple/gray
+        "TIME_LEFT_COLOR": "#750060", # Purple
+        "TIME_LEFT_WEIGHT": "bold",
+        "TIME_LEFT_SIZE": "lg"
+    }
+}
+
+def create_assingment_flex_body(assignment_info: dict, current_time: datetime = None) -> dict:
     """
     Creates a Flex Message for a single assignment.
     
     Args:
-        course_info (dict): Information about the course and assignment.
+        assignment_info (dict): The assignment, in the shape returned by query_assignment.
+        current_time (datetime): Time the time left is counted from, now in Bangkok when None.
         
     Returns:
         body_content (dict): The Flex Message structure.
     """
-    # Load the Flex Message template
-    template_path = 'notifier/flex_body_template.json'
-    
     # -------------------------------- Check time left --------------------------------------------------------------------------
-    current_time = datetime.now(pytz.timezone('Asia/Bangkok'))
+    current_time = current_time or datetime.now(pytz.timezone('Asia/Bangkok'))
     due_date = assignment_info.get('dueDate', '')
     time_left_str, total_seconds_left = calculate_time_left(due_date, current_time)
     # get the state of the assignment
     state = get_assignment_state(assignment_info.get('status', 'UNKNOWN'), total_seconds_left)
-    # Define properties for each state, including text, colors, and font styles
-    state_properties = {
-        "submitted_on_time": {
-            "STATUS_TEXT": "Submitted",
-            "STATUS_BG_COLOR": "#22c55e", # Green
-            "TIME_LEFT_COLOR": "#2d3138", # Dark gray
-            "TIME_LEFT_WEIGHT": "regular",
-            "TIME_LEFT_SIZE": "md"
-        },
-         "submitted_overdue": {
-            "STATUS_TEXT": "Submitted",
-            "STATUS_BG_COLOR": "#22c55e", # Green
-            "TIME_LEFT_COLOR": "#750060", # Purple
-            "TIME_LEFT_WEIGHT": "bold",
-            "TIME_LEFT_SIZE": "lg"
-        },
-        "not_submitted_normal": {
-            "STATUS_TEXT": "Not submitted",
-            "STATUS_BG_COLOR": "#94a3b8", # Light gray/blue
-            "TIME_LEFT_COLOR": "#2d3138", # Dark gray
-            "TIME_LEFT_WEIGHT": "regular",
-            "TIME_LEFT_SIZE": "md"
-        },
-        "not_submitted_warning": {
-            "STATUS_TEXT": "Not submitted",
-            "STATUS_BG_COLOR": "#fab002", # Orange/Yellow
-            "TIME_LEFT_COLOR": "#fab002", # Orange/Yellow
-            "TIME_LEFT_WEIGHT": "bold",
-            "TIME_LEFT_SIZE": "xl"
-        },
-        "not_submitted_critical": {
-            "STATUS_TEXT": "Not submitted",
-            "STATUS_BG_COLOR": "#ef4444", # Red
-            "TIME_LEFT_COLOR": "#ef4444", # Red
-            "TIME_LEFT_WEIGHT": "bold",
-            "TIME_LEFT_SIZE": "3xl"
-        },
-        "not_submitted_overdue": {
-            "STATUS_TEXT": "Not submitted",
-            "STATUS_BG_COLOR": "#574353", # Dark purple/gray
-            "TIME_LEFT_COLOR": "#750060", # Purple
-            "TIME_LEFT_WEIGHT": "bold",
-            "TIME_LEFT_SIZE": "lg"
-        }
-    }
-    
     # Get the properties for the requested state, default to 'not_submitted_normal' if state is unknown
-    props = state_properties.get(state, state_properties["not_submitted_normal"])
+    props = STATE_PROPERTIES.get(state, STATE_PROPERTIES["not_submitted_normal"])
     #----------------------------------------------------------------------------------------------------------------------------
 
 
@@ -177,43 +207,34 @@ def create_assingment_flex_body(assignment_info: dict) -> dict:
         "DETAIL_URL": f"https://alpha.mycourseville.com/course/{assignment_info['courseID']}/assignments/{assignment_info['id']}",
         **props # Unpack state-specific properties
     }
-    with open(template_path, 'r', encoding='utf-8') as file:
-        body_template = file.read()
-    body_content = replace_placeholders(body_template, template_data)
-    body_content = json.loads(body_content)  # Convert string to JSON object
+    # Compiled once per process, filling the slots needs no file read or JSON parse
+    body_content = get_template(BODY_TEMPLATE).render(template_data)
     #----------------------------------------------------------------------------------------------------------------------------
     
     return body_content
 
-def create_crouse_flex_bubble(course_data: dict) ->  tuple[dict,str]:
+def create_crouse_flex_bubble(course_data: dict, current_time: datetime = None) ->  tuple[dict,str]:
     """
     Creates a Flex Bubble for a course with its assignments.
     
     Args:
         corse_data (dict): Information about the course and its assignments.
+        current_time (datetime): Passed on to create_assingment_flex_body.
         
     Returns:
         bubble (dict): The Flex Bubble structure.
         alt (str): The alt text for the Flex Message.
         
     """
-    # Load the Flex Bubble template
-    template_path = 'notifier/flex_header_template.json'
-    with open(template_path, 'r', encoding='utf-8') as file:
-        header_template = file.read()
-    course_info = {
-        "COURSE_TITLE": course_data.get("title", "N/A")
-    }
-    bubble_template = replace_placeholders(header_template, course_info)
-    bubble = json.loads(bubble_template)
     assignments = course_data.get("assignments", [])
     # Create the Flex Message body for the assignment
-    body_contents = []
     if len(assignments) == 0:
         return {}, "No assignments found"
+    bubble = get_template(HEADER_TEMPLATE).render({"COURSE_TITLE": course_data.get("title", "N/A")})
     
+    body_contents = []
     for assignment in assignments:
-        body_cont = create_assingment_flex_body(assignment_info=assignment)
+        body_cont = create_assingment_flex_body(assignment_info=assignment, current_time=current_time)
         body_contents.append(body_cont)
     # Add the body contents to the bubble
     bubble['body']['contents'] = body_contents
@@ -223,50 +244,140 @@ def create_crouse_flex_bubble(course_data: dict) ->  tuple[dict,str]:
 
     return bubble,alt
 
+MAX_PENDING_PUSHES = 64    # submissions queued ahead of the push workers
+MIN_MULTICAST = 2          # recipients sharing a payload before multicast is used
+NOTIFY_CHUNK_USERS = 5000  # due users rendered and grouped before the chunk is sent
+
+def payload_fingerprint(messages: list, memo: dict) -> str:
+    """
+    sha1 of a user's final message list. Each message is serialized once per run: cached bubbles
+    are the same objects for every user, `memo` maps id(message) to (message, digest).
+    """
+    digests = []
+    for message in messages:
+        entry = memo.get(id(message))
+        if entry is None:
+            digest = hashlib.sha1(message.to_json().encode("utf-8")).hexdigest()
+            entry = memo[id(message)] = (message, digest)   # keeps the object alive so its id is not reused
+        digests.append(entry[1])
+    return hashlib.sha1(" ".join(digests).encode("utf-8")).hexdigest()
+
+def user_flags(uid: str, d3: list, d1: list):
+    """update_notify_bulk rows of a notified user, 3-day flags first so a pair in both windows ends with both set."""
+    return [(uid, assignment_id, True, False) for assignment_id in d3] + [(uid, assignment_id, True, True) for assignment_id in d1]
+
+def iter_notify_groups(db: DBManager, now: int, sent_flags: list, render_cache: RenderCache = None,
+                       chunk_users: int = NOTIFY_CHUNK_USERS):
+    """
+    Renders the due users chunk by chunk and groups the users of a chunk whose message lists are identical,
+    so memory is bounded by `chunk_users` rendered users whatever the number of due users.
+    Identical payloads are only grouped within a chunk: a larger chunk means fewer multicasts for more memory.
+
+    Args:
+        sent_flags (list): Receives the flags of users whose courses render no message, as the old
+                           per-user loop did, so their reminders leave the pending schedule.
+
+    Yields:
+        tuple[dict, int]: {fingerprint: (messages, [(user_id, Line_uid, d3, d1)])} and the number of due users in the chunk.
+    """
+    current_time = datetime.fromtimestamp(now, pytz.timezone('Asia/Bangkok'))
+    groups, memo = {}, {}
+    n_users = 0
+    for uid, user in iter_notify_users(db, now):
+        n_users += 1
+        try:
+            messages = process_course_data(user["courses"], current_time, render_cache)
+        except Exception as e:
+            error("notify_engine", f"Failed to create message for {uid}", e)
+        else:
+            if not messages:
+                warn("notify_engine", f"No valid messages to send for user: {uid}")
+                sent_flags.extend(user_flags(uid, user["d3"], user["d1"]))
+            else:
+                fingerprint = payload_fingerprint(messages, memo)
+                groups.setdefault(fingerprint, (messages, []))[1].append((uid, user["l"], user["d3"], user["d1"]))
+        if n_users >= chunk_users:
+            yield groups, n_users
+            groups, memo = {}, {}
+            n_users = 0
+    if n_users:
+        yield groups, n_users
+
+def dispatch_notifications(dispatcher: PushDispatcher, groups: dict, sent_flags: list):
+    """
+    Sends every group: multicast in chunks of MULTICAST_LIMIT when it has MIN_MULTICAST users or more,
+    push otherwise. Users of a failed multicast chunk fall back to one push each of the messages
+    the multicast did not get through, and are flagged once those are delivered.
+
+    Args:
+        sent_flags (list): Receives the (user_id, assignment_id, notify_3d, notify_1d) flags for update_notify_bulk
+                           as users are confirmed, so a failure part-way keeps the users already sent.
+    """
+    pending = {}    # future -> (recipients, messages)
+
+    def submit(recipients, messages):
+        if len(recipients) >= MIN_MULTICAST:
+            future = dispatcher.submit_multicast([line_uid for _, line_uid, _, _ in recipients], messages)
+        else:
+            future = dispatcher.submit(recipients[0][1], messages)
+        pending[future] = (recipients, messages)
+        if len(pending) >= MAX_PENDING_PUSHES:
+            collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
+    def collect(futures):
+        for future in futures:
+            if future not in pending:
+                continue    # already collected by a nested wait during a fallback
+            recipients, messages = pending.pop(future)
+            result = future.result()
+            if not result.ok:
+                if len(recipients) > 1:
+                    # Batches before the failed one were already delivered to every recipient
+                    remaining = messages[result.pushes * MESSAGES_PER_PUSH:]
+                    warn("notify_engine", f"Multicast to {len(recipients)} users failed after {result.pushes} requests, "
+                                          f"pushing the last {len(remaining)} messages one by one", result.error)
+                    for recipient in recipients:
+                        submit([recipient], remaining)
+                else:
+                    error("notify_engine", f"Failed to send message to user {recipients[0][0]}", result.error)
+                continue
+            for uid, _, d3, d1 in recipients:
+                info("notify_engine", f"Send {len(messages)} messages to user: {uid} in {result.latency * 1000:.0f} ms")
+                sent_flags.extend(user_flags(uid, d3, d1))
+
+    for messages, recipients in groups.values():
+        for i in range(0, len(recipients), MULTICAST_LIMIT):
+            submit(recipients[i:i + MULTICAST_LIMIT], messages)
+    while pending:
+        collect(wait(pending, return_when=FIRST_COMPLETED).done)
+
 if __name__ == "__main__":
     print(f"{datetime.now()}: Starting notification engine")
     db = DBManager()
-    try: 
-        users = get_notify_user(db)
-        if not users:
-            info("notify_engine","No users found for notifications.")
-            exit(0)
-    except Exception as e:
-        error("notify_engine",f"Failed to fetch notify users: {e}")
-        exit(1)
-        
-    for uid in users:
+    now = int(time.time())
+    # One render cache per run, users with the same assignments share bubbles
+    render_cache = RenderCache()
+    sent_flags = []
+    n_users = 0
+    with PushDispatcher(access_token, workers=int(os.getenv("LINE_PUSH_WORKERS", PUSH_WORKERS))) as dispatcher:
         try:
-            assignment_data = fetch_assignment_data(db, uid)
+            for groups, chunk_users in iter_notify_groups(db, now, sent_flags, render_cache):
+                n_users += chunk_users
+                info("notify_engine", f"{chunk_users} users share {len(groups)} distinct payloads")
+                dispatch_notifications(dispatcher, groups, sent_flags)
         except Exception as e:
-            error("notify_engine", f"Failed to fetch assignment from DB for user {uid}", e)
-            continue
-        if assignment_data:
-            try:
-                messages = process_course_data(assignment_data)
-            except Exception as e:
-                error("notify_engine", f"Failed to create message for {uid}", e)
-                continue
-            try:
-                if messages:
-                    line_bot = LineBot(access_token, channel_secret)
-                    for i in range(0,len(messages),5):
-                        # Send messages in batches of 5
-                        line_bot.push_noti_message(users[uid]['l'], messages[i:i+5])
-                else:
-                    warn("notify_engine", f"No valid messages to send for user: {uid}")
-                info("notify_engine", f"Send {len(messages)} messages to user: {uid}")
-            except Exception as e:
-                error("notify_engine", f"Failed to send message to user {uid}", {e})
-                continue
-        for assignment_id in users[uid]["d3"]:
-            db.Update_notify(uid, assignment_id, True, False)
-            info("notify_engine", f"Updated 3-day noti for user: {uid}, assignment: {assignment_id}")
-        for assignment_id in users[uid]["d1"]:
-            db.Update_notify(uid, assignment_id, True, True)
-            info("notify_engine", f"Updated 1-day noti for user: {uid}, assignment: {assignment_id}")
-        else:
-            info("notify_engine", f"No upcoming assignment found for user: {uid}")
-    db.commit()
+            # Flags of the users already sent are still written below
+            error("notify_engine",f"Failed to send notifications: {e}")
+    info("notify_engine", "Push stats", json.dumps(dispatcher.stats()))
+
+    if n_users == 0:
+        info("notify_engine","No users found for notifications.")
+    with db.transaction():
+        updated = db.update_notify_bulk(sent_flags)
+        db.mark_notifications_sent(sent_flags, now)
+        expired = db.expire_notifications(now)
+    info("notify_engine", f"Updated {updated} notification flags for {n_users} users, dropped {expired} expired reminders")
+    info("notify_engine", "Render cache", json.dumps(render_cache.stats()))
     db.close()
-    info("notify_engine", "Notification engine finished processing.")
\ No newline at end of file
+    instrument.dump("notify_engine")
+    info("notify_engine", "Notification engine finished processing.")
@@ -1,14 +1,181 @@
 import requests
+import threading
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import os
 import re
+import html
 import json
+import time
+import base64
+
+# Hosts are overridable so the scraper can run against test/mock_mcv.py
+MCV_URL = os.getenv("MCV_URL", "https://www.mycourseville.com")
+ALPHA_URL = os.getenv("MCV_ALPHA_URL", "https://alpha.mycourseville.com")
+API_URL = os.getenv("MCV_API_URL", "https://api.alpha.mycourseville.com")
+
+DEFAULT_BUNDLE_PATH = "/assets/index-BT6DwrJv.js"
+CLIENT_ID_PATTERN = re.compile(rb'https?:\/\/[^\s"\']+client_id=([a-zA-Z0-9_-]{20,})')
+CLIENT_ID_CACHE_PATH = "database/client_id.json"
+CLIENT_ID_TTL = 6 * 3600
+CHUNK_SIZE = 64 * 1024
+
+_client_id_cache = {}
+_client_id_lock = threading.Lock()
+
+def _load_client_id_cache():
+    """Load the on-disk client_id cache into the process cache."""
+    try:
+        with open(CLIENT_ID_CACHE_PATH, 'r', encoding='utf-8') as file:
+            _client_id_cache.update(json.load(file))
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return _client_id_cache
+
+def _save_client_id_cache(entry):
+    _client_id_cache.clear()
+    _client_id_cache.update(entry)
+    try:
+        with open(CLIENT_ID_CACHE_PATH, 'w', encoding='utf-8') as file:
+            json.dump(entry, file)
+    except OSError as e:
+        print(f"Could not write client_id cache: {e}")
+
+def _counted(chunks, counter):
+    """Yields `chunks`, adding their lengths to counter[0] (for TransportStats.record)."""
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+def _search_stream(chunks, pattern, overlap=512):
+    """
+    Search a regex over a byte stream without holding the whole body.
+    The tail of each chunk is carried over so matches spanning two chunks are still found.
+    """
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        match = pattern.search(buffer)
+        # A match touching the end of the buffer may continue in the next chunk
+        if match and match.end() < len(buffer):
+            return match.group(1).decode('ascii')
+        buffer = buffer[-overlap:]
+    match = pattern.search(buffer)
+    return match.group(1).decode('ascii') if match else None
+
+_TOKEN_INPUT = re.compile(r'<input\b[^>]*?\bname\s*=\s*["\']?_token\b[^>]*>', re.IGNORECASE)
+_VALUE_ATTR = re.compile(r'\bvalue\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+
+def extract_csrf_token(html_text):
+    """
+    Return the value of the login form's <input name="_token">, or None.
+    A regex over the first matching input tag handles the usual page; anything it
+    cannot read falls back to a full BeautifulSoup parse.
+    """
+    tag = _TOKEN_INPUT.search(html_text)
+    if tag:
+        value = _VALUE_ATTR.search(tag.group(0))
+        if value:
+            return html.unescape(next(v for v in value.groups() if v is not None))
+    soup = BeautifulSoup(html_text, 'html.parser')
+    token_input = soup.find('input', {'name': '_token'})
+    return token_input.get('value') if token_input else None
+
+COURSE_FIELDS = ["courseID", "title", "courseNumber", "courseYear", "thumbnail", "semester"]
+ASSIGNMENT_FIELDS = ["courseID", "id", "title", "type", "status", "outDate", "dueDate"]
+# Always requested: upsert_courses/upsert_assignments write them, a missing one would overwrite stored values with NULL
+REQUIRED_COURSE_FIELDS = ["courseID", "title", "courseNumber", "semester", "courseYear"]
+REQUIRED_ASSIGNMENT_FIELDS = ["id", "courseID", "title", "type", "status", "dueDate"]
+
+class TransportStats:
+    """Process-wide request and byte counters for every scraper session."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.wire_bytes = 0      # body bytes as received (compressed)
+            self.decoded_bytes = 0   # body bytes after decompression
+
+    def record(self, response, decoded=None):
+        """
+        Counts one response whose body has been read. Buffered bodies are measured with
+        len(response.content); a streamed body is read by the caller, who passes its decoded size.
+        """
+        if decoded is None:
+            decoded = len(response.content)
+        try:
+            wire = response.raw.tell()  # bytes urllib3 read off the socket, before decompression
+        except Exception:
+            wire = decoded
+        with self._lock:
+            self.requests += 1
+            self.wire_bytes += wire
+            self.decoded_bytes += decoded
+
+    def snapshot(self):
+        with self._lock:
+            return {"requests": self.requests, "wire_bytes": self.wire_bytes, "decoded_bytes": self.decoded_bytes}
+
+    def merge(self, snapshot):
+        """Adds another process's snapshot() to these counters."""
+        with self._lock:
+            self.requests += snapshot["requests"]
+            self.wire_bytes += snapshot["wire_bytes"]
+            self.decoded_bytes += snapshot["decoded_bytes"]
+
+transport_stats = TransportStats()
+
+class HostLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that caps in-flight requests per host across every scraper sharing it."""
+    def __init__(self, max_per_host=4, **kwargs):
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self.max_per_host = max_per_host
+        super().__init__(**kwargs)
+
+    def set_max_per_host(self, limit):
+        """
+        Changes the per-host cap. Semaphores are rebuilt lazily with the new limit;
+        requests already in flight finish on the old ones.
+        """
+        with self._lock:
+            self.max_per_host = limit
+            self._semaphores = {}
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def send(self, request, **kwargs):
+        with self._semaphore(urlparse(request.url).hostname):
+            return super().send(request, **kwargs)
+
+class MeteredSession(requests.Session):
+    """requests.Session that feeds `transport_stats`. Streamed responses are recorded by the caller once read."""
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if not kwargs.get("stream"):
+            transport_stats.record(response)
+        return response
+
+# One connection pool per host shared by every scraper; cookies stay on each session
+POOL_MAXSIZE = 16
+shared_adapter = HostLimitedAdapter(max_per_host=4, pool_connections=8, pool_maxsize=POOL_MAXSIZE)
 
 class CVScraper:
     """A class to scrape Courseville website for login and session management."""
     def __init__(self,username=None, password=None):
-        self.session = requests.Session()
+        self.session = MeteredSession()
+        self.session.mount("https://", shared_adapter)
+        self.session.mount("http://", shared_adapter)
         self.username = username
         self.password = password
         self._configure_session()
@@ -18,7 +185,7 @@ class CVScraper:
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'identity',
+            'Accept-Encoding': ACCEPT_ENCODING,   # gzip/deflate, plus br with the Brotli package (requirements.txt)
             'Upgrade-Insecure-Requests': '1',
             'has_js':'1',
             'Connection': 'keep-alive'
@@ -36,7 +203,7 @@ class CVScraper:
         """Make initial request to get session cookies"""
         if show:
             print("Fetching homepage...")
-        response = self.session.get("https://www.mycourseville.com")
+        response = self.session.get(MCV_URL)
         response.raise_for_status()
         if show:
             print(f"Initial Cookies: {self._get_cookie(response)}\n--------------------------")
@@ -44,7 +211,7 @@ class CVScraper:
     
     def _get_login_page(self,show = False):
         """GET login page and handle response"""
-        login_url = "https://www.mycourseville.com/api/oauth/authorize?response_type=code&client_id=mycourseville.com&redirect_uri=https://www.mycourseville.com&login_page=itchula"
+        login_url = f"{MCV_URL}/api/oauth/authorize?response_type=code&client_id=mycourseville.com&redirect_uri=https://www.mycourseville.com&login_page=itchula"
         if show:
             print("Fetching login page...")
         response = self.session.get(login_url)
@@ -63,15 +230,13 @@ class CVScraper:
     
     def _extract_csrf_token(self, login_page_response,show = False):
         """Extract CSRF token from login page HTML"""
-        soup = BeautifulSoup(login_page_response.text, 'html.parser')
-        token_input = soup.find('input', {'name': '_token'})
-        
-        if not token_input:
+        token = extract_csrf_token(login_page_response.text)
+
+        if token is None:
             print("Error: Could not find CSRF token in login page!")
             print("status code:", login_page_response.status_code)
             return None
 
-        token = token_input.get('value')
         if show:
             print(f"Extracted CSRF Token: {token}\n--------------------------")
         return token
@@ -88,7 +253,7 @@ class CVScraper:
             print("Attempting login...")
             print(f"Login Data: {login_data}")
         response = self.session.post(
-            "https://www.mycourseville.com/api/chulalogin",
+            f"{MCV_URL}/api/chulalogin",
             data=login_data,
             allow_redirects=True
         )
@@ -96,7 +261,7 @@ class CVScraper:
     
     def _verify_login(self,show = False):
         """Verify successful login by checking protected page"""
-        dashboard = self.session.get("https://www.mycourseville.com/")
+        dashboard = self.session.get(f"{MCV_URL}/")
         if "2024" in dashboard.text.lower():
             if show:
                 print("Login Verified\n--------------------------")
@@ -133,14 +298,103 @@ class CVScraper:
     
 class CVaScraper(CVScraper):
     """A class to scrape Courseville website for course information."""
-    def __init__(self,username, password, show=False):
+    TOKEN_TTL = 3600        # fallback lifetime (seconds) when the token carries no expiry
+    TOKEN_MARGIN = 60       # treat tokens expiring within this window as expired
+    # /auth/refresh is only known from test/mock_mcv.py; once mCV answers 404 the process stops
+    # trying it and stops keeping refresh tokens, so saved sessions go straight to a login
+    refresh_supported = True
+
+    def __init__(self,username, password, show=False, auth_session=None):
         super().__init__(username=username, password=password)
+        self.show = show
+        self.client_id = None
+        self.auth_token = None
+        self.refresh_token = None
+        self.expires_at = 0
+        if not (auth_session and self.restore_session(auth_session, show)):
+            self.login(show)
+
+    def login(self, show = False):
+        """Full login: chulalogin, client_id discovery and OAuth token grant."""
+        self.session.cookies.clear()
         self.run(show)
         self.client_id = self.get_client_id(show)
-        token = self.grant_token(show)
+        self._set_token(self.grant_token(show))
+
+    def _set_token(self, token):
         self.auth_token = token['access_token']
-        self.refresh_token = token['refresh_token']
-        
+        self.refresh_token = token.get('refresh_token', self.refresh_token) if CVaScraper.refresh_supported else None
+        if token.get('expires_in'):
+            self.expires_at = int(time.time()) + int(token['expires_in'])
+        else:
+            self.expires_at = self._jwt_expiry(self.auth_token) or int(time.time()) + self.TOKEN_TTL
+
+    @staticmethod
+    def _jwt_expiry(token):
+        """Read the `exp` claim of a JWT access token, None if it is not a JWT."""
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+        except Exception:
+            return None
+
+    def is_token_valid(self):
+        return bool(self.auth_token) and self.expires_at - self.TOKEN_MARGIN > time.time()
+
+    def restore_session(self, auth_session, show = False):
+        """
+        Restore tokens and cookies saved by `export_session`.
+        Returns True when the scraper holds a usable token afterwards (refreshing it if needed).
+        """
+        for c in json.loads(auth_session.get('cookies') or '[]'):
+            self.session.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'])
+        self.auth_token = auth_session.get('auth_token')
+        self.refresh_token = auth_session.get('refresh_token')
+        self.expires_at = auth_session.get('expires_at') or 0
+        if self.is_token_valid():
+            if show: print("Reusing cached token")
+            return True
+        return self.refresh_auth(show)
+
+    def refresh_auth(self, show = False):
+        """Refresh the access token with the refresh token. Returns False if mCV rejects it."""
+        if not (self.refresh_token and CVaScraper.refresh_supported):
+            return False
+        if show: print("Refreshing token...")
+        try:
+            response = self.session.post(f"{API_URL}/auth/refresh",
+                                         json={"refresh_token": self.refresh_token})
+        except requests.exceptions.RequestException as e:
+            if show: print(f"Token refresh failed: {e}")
+            return False
+        if response.status_code in (404, 405):
+            if show: print("Token refresh is not available, logging in again")
+            CVaScraper.refresh_supported = False
+            self.refresh_token = None
+            return False
+        if response.status_code != 200:
+            if show: print(f"Token refresh failed: {response.status_code}")
+            return False
+        self._set_token(response.json())
+        return True
+
+    def reauthenticate(self, show = False):
+        """Refresh the token, falling back to a full login."""
+        if not self.refresh_auth(show):
+            self.login(show)
+
+    def export_session(self):
+        """Serialize tokens and cookies so a later run can skip the login."""
+        cookies = [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+                   for c in self.session.cookies]
+        return {
+            "auth_token": self.auth_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.expires_at,
+            "cookies": json.dumps(cookies)
+        }
+
     def _update_session_headers(self,auth_token=None):
         self.session.headers.update({
             'Authorization': f'Bearer {auth_token}',
@@ -151,20 +405,70 @@ class CVaScraper(CVScraper):
         
     
     def get_client_id(self,show = False):
-        js_url = "https://alpha.mycourseville.com/assets/index-BT6DwrJv.js"
-        #Download the JS file
-        response = self.session.get(js_url)
-        if show:
-            print(f"Response status code: {response.status_code}")
-        js_code = response.text
+        """
+        Returns the alpha.mycourseville.com OAuth client_id.
+        The value is the same for every user, so it is cached in memory and on disk for CLIENT_ID_TTL
+        seconds and revalidated against the bundle's ETag/Last-Modified once stale.
+        """
+        with _client_id_lock:
+            cached = _client_id_cache or _load_client_id_cache()
+            if cached and time.time() - cached["fetched_at"] < CLIENT_ID_TTL:
+                return cached["client_id"]
+            if cached:
+                client_id = self._fetch_client_id(cached["bundle_url"], cached, show)
+                if client_id:
+                    return client_id
+            # No cache, or the cached bundle is gone (mCV redeployed): find the current one
+            client_id = self._fetch_client_id(self._discover_bundle_url(show), None, show)
+            if client_id:
+                return client_id
+        raise Exception("!!!ALERT!!! client_id not found in script.")
+
+    def _discover_bundle_url(self, show = False):
+        """Find the current index-*.js bundle from the alpha.mycourseville.com entry page."""
+        response = self.session.get(f"{ALPHA_URL}/")
+        match = re.search(r'src="(/assets/index-[\w-]+\.js)"', response.text)
+        if not match:
+            if show: print("Bundle not found in entry page, using default")
+            return ALPHA_URL + DEFAULT_BUNDLE_PATH
+        return ALPHA_URL + match.group(1)
+
+    def _fetch_client_id(self, js_url, cached=None, show = False):
+        """
+        Download `js_url` (conditionally when `cached` is given) and stream-search it for the client_id.
+        Returns None if the bundle is missing or does not contain one.
+        """
+        headers = {}
+        if cached:
+            if cached.get("etag"): headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"): headers["If-Modified-Since"] = cached["last_modified"]
+        with self.session.get(js_url, headers=headers, stream=True) as response:
+            if show:
+                print(f"Response status code: {response.status_code}")
+            decoded = [0]
+            if response.status_code == 304:
+                client_id = cached["client_id"]
+            elif response.status_code == 200:
+                client_id = _search_stream(_counted(response.iter_content(CHUNK_SIZE), decoded), CLIENT_ID_PATTERN)
+            else:
+                client_id = None
+            transport_stats.record(response, decoded[0])
+            if client_id:
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                if response.status_code == 304:
+                    # A 304 may omit either validator, keep the cached one then
+                    etag = etag or cached.get("etag")
+                    last_modified = last_modified or cached.get("last_modified")
+                _save_client_id_cache({
+                    "client_id": client_id,
+                    "bundle_url": js_url,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "fetched_at": time.time()
+                })
+            return client_id
 
-        #Search for client_id pattern
-        match = re.search(r'https?:\/\/[^\s"\']+client_id=([a-zA-Z0-9_-]{20,})', js_code)
-        if match:
-            return match.group(1)
-        else:
-            raise Exception("!!!ALERT!!! client_id not found in script.")
-        
     @staticmethod
     def get_body_length(body):
         return len(str(body).encode("utf-8"))
@@ -172,7 +476,7 @@ class CVaScraper(CVScraper):
     def grant_token(self,show = False):
         """Grant token to access Courseville API"""
         if show: print("Granting token...")
-        url = f"https://www.mycourseville.com/api/oauth/authorize?response_type=code&client_id={self.client_id}&redirect_uri=https://alpha.mycourseville.com/&state=/course"
+        url = f"{MCV_URL}/api/oauth/authorize?response_type=code&client_id={self.client_id}&redirect_uri=https://alpha.mycourseville.com/&state=/course"
         response = self.session.get(url,allow_redirects=False)
         if response.status_code != 302:
             raise Exception(f"!!!ALERT!!! code extracttion Error: {response.status_code}")
@@ -180,15 +484,15 @@ class CVaScraper(CVScraper):
         code = re.search(r'[?&]code=([^&]+)', location).group(1)    # Extract the code from the URL
         if show: print(f"Code: {code}")
         # Make a POST request to get the token
-        api_url = "https://api.alpha.mycourseville.com/auth/login"
+        api_url = f"{API_URL}/auth/login"
         body = {"code": code}
         headers = {
-            'Host': 'api.alpha.mycourseville.com',
+            'Host': urlparse(API_URL).netloc,
             'Content-Length': str(self.get_body_length(body)),
             'Accept': 'application/json, text/plain, */*',
             'Content-Type': 'application/json'}
         if show: print(f"headers: {headers}")
-        token = requests.post(api_url,headers=headers, json=body)
+        token = self.session.post(api_url,headers=headers, json=body)
         if token.status_code == 200:
             token_data = json.loads(token.text)
             if show: print(f"Token: {token_data}")
@@ -196,7 +500,7 @@ class CVaScraper(CVScraper):
         else: 
             raise Exception(f"!!!ALERT!!! token granting Error: {token.status_code} \ntext: {token.text}")
     
-    def query_assignment(self,semester = 1, year = 2023, filter ="ALL"):
+    def query_assignment(self,semester = 1, year = 2023, filter ="ALL", retry = True):
         """Query assignment data from Courseville API."""
         playload = {
             "query":"query AssignmentSummaryPageQuery($semester: String! $year: String! $filter: AssignmentFilter!) {...AssignmentSummaryFragment_bZQ9B}\
@@ -208,11 +512,62 @@ class CVaScraper(CVScraper):
                                 {courseID id title type status outDate dueDate}}}}}",
             "variables":{"semester":semester,"year":year,"filter":filter}
             }
+        return self._post_query(playload, retry)
+
+    def query_assignments_batch(self, semesters, filter ="ALL", course_fields=None, assignment_fields=None):
+        """
+        Query several semesters in one POST using GraphQL aliases.
+
+        Args:
+            semesters (list): (semester, year) pairs.
+            filter (str): AssignmentFilter applied to every semester.
+            course_fields (list | None): Course fields to request, defaults to COURSE_FIELDS.
+                                         REQUIRED_COURSE_FIELDS are always added, so only thumbnail can be trimmed.
+            assignment_fields (list | None): Assignment fields to request, defaults to ASSIGNMENT_FIELDS.
+                                             REQUIRED_ASSIGNMENT_FIELDS are always added, so only outDate can be trimmed.
+
+        Returns:
+            dict: {(semester, year): course list} in the shape returned by `query_assignment`,
+                  trimmed fields are set to None. Safe to pass to upsert_course(s)/upsert_assignment(s).
+        """
+        course_fields = list(dict.fromkeys([*REQUIRED_COURSE_FIELDS, *(course_fields or COURSE_FIELDS)]))
+        assignment_fields = list(dict.fromkeys([*REQUIRED_ASSIGNMENT_FIELDS, *(assignment_fields or ASSIGNMENT_FIELDS)]))
+        selection = f"{' '.join(course_fields)} assignments(filter: $filter) {{{' '.join(assignment_fields)}}}"
+        params, aliases, variables = [], [], {"filter": filter}
+        for i, (semester, year) in enumerate(semesters):
+            params.append(f"$semester{i}: String! $year{i}: String!")
+            aliases.append(f"s{i}: myCoursesBySemester(semester: $semester{i}, year: $year{i}) {{student {{{selection}}}}}")
+            variables[f"semester{i}"] = str(semester)
+            variables[f"year{i}"] = str(year)
+        playload = {
+            "query": f"query AssignmentBatchQuery({' '.join(params)} $filter: AssignmentFilter!) {{me {{{' '.join(aliases)}}}}}",
+            "variables": variables
+            }
+        me = self._post_query(playload)["data"]["me"]
+
+        result = {}
+        for i, key in enumerate(semesters):
+            courses = (me.get(f"s{i}") or {}).get("student") or []
+            for course in courses:
+                for field in COURSE_FIELDS:
+                    course.setdefault(field, None)
+                for a in course.get("assignments", []):
+                    for field in ASSIGNMENT_FIELDS:
+                        a.setdefault(field, None)
+            result[key] = courses
+        return result
+
+    def _post_query(self, playload, retry = True):
+        """POST a GraphQL payload to /query, re-authenticating once on 401."""
         headers = {'Authorization': f'Bearer {self.auth_token}',
                 'Content-Type': 'application/json',
                 'Content-Length': str(CVaScraper.get_body_length(playload))}
 
-        data_res = self.session.post("https://api.alpha.mycourseville.com/query",headers=headers,json=playload)
+        data_res = self.session.post(f"{API_URL}/query",headers=headers,json=playload)
+        if data_res.status_code == 401 and retry:
+            # Cached token was revoked server side
+            self.reauthenticate(self.show)
+            return self._post_query(playload, retry=False)
         if data_res.status_code == 200:
             return data_res.json()
         else:
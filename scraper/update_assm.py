@@ -1,7 +1,15 @@
 import sqlite3
-from scraper.scraper import CVaScraper
+import argparse
+import hashlib
+import json
+import zlib
+import queue
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from scraper.scraper import CVaScraper, shared_adapter, transport_stats
 from datetime import datetime
 from database.DB_manager import DBManager
+from database import instrument
 from Utility.Cipher import cipher
 from Utility.logger import info, error, warn
 
@@ -27,45 +35,259 @@ def get_semester_info():
 
     return semester,academic_year
     
-def get_assingment(cname,cpass):
-    scraper = CVaScraper(username=cname, password=cpass, show=False)
-    sem, aca_year = get_semester_info()
-    # sem,aca_year = 1,2023
-    data = scraper.query_assignment(sem, aca_year)
-    return data["data"]["me"]["myCoursesBySemester"]["student"]
-    
-    
+def get_assingment(cname,cpass,auth_session=None):
+    """
+    Fetches this semester's courses for one user.
+
+    Args:
+        cname (str): mCV username.
+        cpass (str): mCV password.
+        auth_session (dict | None): Tokens/cookies cached by a previous run, skips the login when still valid.
+
+    Returns:
+        tuple[list, dict]: The course list and the auth session to cache for the next run.
+    """
+    scraper = CVaScraper(username=cname, password=cpass, show=False, auth_session=auth_session)
+    semester = get_semester_info()
+    # semester = (1, 2023)
+    courses = scraper.query_assignments_batch([semester])[semester]
+    return courses, scraper.export_session()
+
+def fetch_user(c, user_id, encname, encpass, auth_session=None):
+    """
+    Worker side of the sync: decrypts the credentials and scrapes one user.
+    Runs in a worker thread with its own CVaScraper/requests.Session and never touches the database.
+
+    Returns:
+        tuple[str, list, dict]: user_id, course list and the auth session to cache.
+    """
+    cname = c.decrypt(encname)
+    cpass = c.decrypt(encpass)
+    assignments_data, auth_session = get_assingment(cname, cpass, auth_session)
+    return user_id, assignments_data, auth_session
+
+def course_hash(course):
+    """Stable content hash of one course payload from query_assignments_batch."""
+    return hashlib.sha256(json.dumps(course, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def write_user(db, user_id, assignments_data):
+    """
+    Writer side of the sync: upserts one user's courses and assignments.
+    Courses whose payload hash matches the last run are skipped entirely, otherwise only
+    assignments whose stored fields or status differ are written, in bulk.
+    New links get their reminders scheduled and moved due dates reschedule every user's reminders.
+
+    Returns:
+        dict: Row counts {"inserted": int, "updated": int, "skipped": int}.
+    """
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    stored_hashes = db.fetch_course_hashes(user_id)
+    changed = []
+    for course in assignments_data:
+        content_hash = course_hash(course)
+        if stored_hashes.get(course["courseID"]) == content_hash:
+            counts["skipped"] += len(course["assignments"])
+        else:
+            changed.append((course, content_hash))
+    if not changed:
+        return counts
+
+    stored = db.fetch_course_assignment_state(user_id, [course["courseID"] for course, _ in changed])
+    assignments, moved, links, statuses = [], [], [], []
+    for course, _ in changed:
+        for a in course["assignments"]:
+            row = stored.get(a["id"])
+            fields = (a["courseID"], a["dueDate"], a["title"], a["type"])
+            if row is None or row[:4] != fields:
+                assignments.append(a)
+                if row is not None and row[1] != a["dueDate"]:
+                    moved.append(a)
+            if row is None or row[4] is None:
+                links.append((user_id, a["id"], a["status"]))
+                counts["inserted"] += 1
+            elif row[4] != a["status"]:
+                statuses.append((user_id, a["id"], a["status"]))
+                counts["updated"] += 1
+            elif row[:4] != fields:
+                counts["updated"] += 1
+            else:
+                counts["skipped"] += 1
+
+    db.upsert_courses(course for course, _ in changed)
+    db.upsert_assignments(assignments)
+    db.reschedule_notifications(moved)
+    db.assign_to_users_bulk(links)
+    db.schedule_notifications((user_id, assignment_id) for user_id, assignment_id, _ in links)
+    db.update_assignment_statuses(statuses)
+    db.upsert_course_hashes((user_id, course["courseID"], content_hash) for course, content_hash in changed)
+    return counts
+
+def write_result(db, user_id, result, totals, run_id=None):
+    """
+    Writes one scraped user (or records its failure) and commits it.
+
+    Args:
+        result (tuple | Exception): (assignments_data, auth_session) from the scrape, or the error it raised.
+        totals (dict): Running inserted/updated/skipped counts, updated in place.
+    """
+    if isinstance(result, Exception):
+        if run_id is not None:
+            db.set_job_status(run_id, user_id, "failed", str(result))
+            db.commit()
+        error("update_assm", f"Error fetching from mCV {user_id}",result)
+        return
+    assignments_data, auth_session = result
+    # One transaction per user: the rows, the cached session and the checkpoint commit together
+    with db.transaction():
+        db.upsert_auth_session(user_id, auth_session)
+        if assignments_data:
+            for key, n in write_user(db, user_id, assignments_data).items():
+                totals[key] += n
+        if run_id is not None:
+            db.set_job_status(run_id, user_id, "done")
+    if not assignments_data:
+        warn("update_assm", f"NO data from mCV for user: {user_id}")
+
+PENDING_PER_WORKER = 4     # scrape jobs queued per worker thread, bounds the users held in memory
+
+def _dispatch(db, users):
+    """Attaches each user's cached auth session to their scrape job, lazily."""
+    return ((user_id, encname, encpass, db.fetch_auth_session(user_id)) for user_id, encname, encpass in users)
+
+def sync_users(db, users, workers=8, run_id=None):
+    """
+    Scrapes users concurrently and funnels every result into a single writer (this thread),
+    since the sqlite3 connection held by `db` must not be shared across threads.
+    Each user is committed as soon as it is written, so an interrupted run keeps its progress.
+    Users are read as they are submitted, at most PENDING_PER_WORKER per worker ahead of the writer.
+
+    Args:
+        db (DBManager): The database manager instance, only used from the calling thread.
+        users (iterable): (user_id, encrypted cname, encrypted cpass) rows, e.g. db.iter_users().
+        workers (int): Number of users scraped at the same time.
+        run_id (int | None): sync_run whose jobs are checkpointed, None to skip job tracking.
+    """
+    c = cipher()
+    totals = {"inserted": 0, "updated": 0, "skipped": 0}
+
+    def collect(done):
+        for future in done:
+            try:
+                _, assignments_data, auth_session = future.result()
+                result = (assignments_data, auth_session)
+            except Exception as e:
+                result = e
+            write_result(db, futures.pop(future), result, totals, run_id)
+
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for job in _dispatch(db, users):
+            futures[pool.submit(fetch_user, c, *job)] = job[0]
+            if len(futures) >= workers * PENDING_PER_WORKER:
+                collect(wait(futures, return_when=FIRST_COMPLETED).done)
+        collect(list(as_completed(futures)))
+    return totals
+
+def shard_of(user_id, shards):
+    """Stable shard index of a user (crc32, unlike hash(), is the same in every process)."""
+    return zlib.crc32(user_id.encode("utf-8")) % shards
+
+def _scrape_shard(jobs, workers, host_limit, results):
+    """
+    Body of one shard process: scrapes its users on a thread pool and streams
+    (user_id, result) back to the writer, then (None, transport stats) as its end marker.
+    """
+    shared_adapter.set_max_per_host(host_limit)
+    c = cipher()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_user, c, *job): job[0] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                _, assignments_data, auth_session = future.result()
+                results.put((futures[future], (assignments_data, auth_session)))
+            except Exception as e:
+                # Exceptions from requests/urllib3 do not always pickle, send the message
+                results.put((futures[future], Exception(str(e))))
+    results.put((None, transport_stats.snapshot()))
+
+def sync_users_sharded(db, users, processes=2, workers=8, host_limit=4, run_id=None):
+    """
+    Partitions users by `shard_of` across a pool of processes, each running its own
+    concurrent scrape loop. Results stream back over a queue to this process, the only DB writer.
+    Note the per-host cap applies per process, so the effective cap is processes * host_limit,
+    and the jobs are split up front, so unlike sync_users every user is held in memory.
+
+    Args:
+        processes (int): Number of shard processes.
+        workers (int): Scraping threads per process.
+        host_limit (int): Max in-flight requests per mCV host per process.
+
+    Returns:
+        dict: Row counts {"inserted": int, "updated": int, "skipped": int}.
+    """
+    shards = [[] for _ in range(processes)]
+    for job in _dispatch(db, users):
+        shards[shard_of(job[0], processes)].append(job)
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_scrape_shard, args=(jobs, workers, host_limit, results), daemon=True)
+             for jobs in shards if jobs]
+    for proc in procs:
+        proc.start()
+
+    totals = {"inserted": 0, "updated": 0, "skipped": 0}
+    running = len(procs)
+    while running:
+        try:
+            item = results.get(timeout=5)
+        except queue.Empty:
+            # A shard that died without its sentinel leaves its jobs pending for --resume
+            if not any(proc.is_alive() for proc in procs):
+                break
+            continue
+        if item[0] is None:
+            # The shard's requests never touch this process's counters, add them in
+            transport_stats.merge(item[1])
+            running -= 1
+            continue
+        write_result(db, item[0], item[1], totals, run_id)
+    for proc in procs:
+        proc.join()
+    return totals
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync mCV assignments for every registered user.")
+    parser.add_argument("--workers", type=int, default=8, help="users scraped concurrently")
+    parser.add_argument("--host-limit", type=int, default=4, help="max in-flight requests per mCV host")
+    parser.add_argument("--resume", action="store_true", help="continue the unfinished users of the last run")
+    parser.add_argument("--processes", type=int, default=1, help="shard users across this many processes")
+    parser.add_argument("--db-stats", action="store_true", help="record per-query latency and log it at the end")
+    args = parser.parse_args()
+    shared_adapter.set_max_per_host(args.host_limit)
+    if args.db_stats:
+        instrument.set_enabled()
+
     db = DBManager()
     print(f"{datetime.now()}: Starting assignment update process...")
     try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect("database/main.db")
-        cursor = conn.cursor()
-        c = cipher()
-
-        # Fetch users
-        cursor.execute("SELECT user_id, cname, cpass FROM user")
-        users = cursor.fetchall()
-
-        for user_id, encname, encpass in users:
-            cname = c.decrypt(encname)
-            cpass = c.decrypt(encpass)
-            try:
-                assignments_data = get_assingment(cname,cpass)
-                if not assignments_data:
-                    warn("update_assm", f"NO data from mCV for user: {user_id}")
-                    continue
-            except Exception as e:
-                error("update_assm", f"Error fetching from mCV {user_id}",e)
-                continue
-            for course in assignments_data:
-                db.upsert_course(course)
-                for a in course["assignments"]:
-                    db.upsert_assignment(a)
-                    db.assign_to_users(user_id,a["id"],a["status"])
-        info("update_assm", "Assignments updated successfully")
+        run_id = db.fetch_resumable_run() if args.resume else None
+        if run_id is not None:
+            users = db.fetch_unfinished_users(run_id)
+            info("update_assm", f"Resuming sync run {run_id} with {len(users)} unfinished users")
+        else:
+            run_id = db.start_sync_run()
+            users = db.iter_users()
+        db.commit()
+
+        if args.processes > 1:
+            totals = sync_users_sharded(db, users, processes=args.processes, workers=args.workers,
+                                        host_limit=args.host_limit, run_id=run_id)
+        else:
+            totals = sync_users(db, users, workers=args.workers, run_id=run_id)
+        db.finish_sync_run(run_id)
+        info("update_assm", "Assignments updated successfully", json.dumps(totals))
+        info("update_assm", "Transport stats", json.dumps(transport_stats.snapshot()))
     except sqlite3.Error as e:
         error("update_assm", f"SQLite error",e)
     except Exception as e:
@@ -73,4 +295,4 @@ if __name__ == "__main__":
     finally:
         db.commit()
         db.close()
-    
+        instrument.dump("update_assm")
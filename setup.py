@@ -1,4 +1,5 @@
 import sqlite3
+from database.DB_manager import DBManager
 
 conn = sqlite3.connect("database/main.db")
 cur = conn.cursor()
@@ -11,10 +12,15 @@ CREATE TABLE IF NOT EXISTS course (
     type TEXT,
     courseNumber TEXT,
     thumbnail TEXT,
-    semester TEXT
+    semester TEXT,
+    courseYear TEXT      -- academic year of the semester, as mCV reports it
 )
 """)
 
+# Migration: courseYear was added after the first release
+if "courseYear" not in [row[1] for row in cur.execute("PRAGMA table_info(course)")]:
+    cur.execute("ALTER TABLE course ADD COLUMN courseYear TEXT")
+
 # Create Assignment table
 cur.execute("""
 CREATE TABLE IF NOT EXISTS assignment (
@@ -23,10 +29,15 @@ CREATE TABLE IF NOT EXISTS assignment (
     due_date DATETIME,
     name TEXT,
     type TEXT,
+    due_epoch INTEGER,   -- due_date as UTC epoch seconds, indexed for the notification windows
     FOREIGN KEY (course_id) REFERENCES course(course_id)
 )
 """)
 
+# Migration: due_epoch was added after the first release
+if "due_epoch" not in [row[1] for row in cur.execute("PRAGMA table_info(assignment)")]:
+    cur.execute("ALTER TABLE assignment ADD COLUMN due_epoch INTEGER")
+
 # Create User table
 cur.execute("""
 CREATE TABLE IF NOT EXISTS user (
@@ -51,14 +62,87 @@ CREATE TABLE IF NOT EXISTS user_assignments (
 )
 """)
 
+# Create Course_Sync table (content hash of the last synced course payload per user)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS course_sync (
+    user_id TEXT,
+    course_id TEXT,
+    content_hash TEXT,
+    PRIMARY KEY (user_id, course_id),
+    FOREIGN KEY (user_id) REFERENCES user(user_id),
+    FOREIGN KEY (course_id) REFERENCES course(course_id)
+)
+""")
+
+# Create Sync_Run / Sync_Job tables (checkpoints of update_assm runs)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS sync_run (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT DEFAULT (datetime('now', '+7 hours')),
+    finished_at TEXT
+)
+""")
+
+cur.execute("""
+CREATE TABLE IF NOT EXISTS sync_job (
+    run_id INTEGER,
+    user_id TEXT,
+    status TEXT DEFAULT 'pending',  -- pending, done, failed
+    attempts INTEGER DEFAULT 0,
+    error TEXT,
+    updated_at TEXT DEFAULT (datetime('now', '+7 hours')),
+    PRIMARY KEY (run_id, user_id),
+    FOREIGN KEY (run_id) REFERENCES sync_run(run_id),
+    FOREIGN KEY (user_id) REFERENCES user(user_id)
+)
+""")
+
+# Create Auth_Session table (cached mCV tokens/cookies per user, AES-GCM encrypted with secret/session_key.bin)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS auth_session (
+    user_id TEXT PRIMARY KEY,
+    auth_token TEXT,
+    refresh_token TEXT,
+    expires_at INTEGER,
+    cookies TEXT,
+    updated_at TEXT DEFAULT (datetime('now', '+7 hours')),
+    FOREIGN KEY (user_id) REFERENCES user(user_id)
+)
+""")
+
+# Create Notification_Schedule table (pending and sent 3d/1d reminders, written at sync time)
+cur.execute("""
+CREATE TABLE IF NOT EXISTS notification_schedule (
+    user_id TEXT,
+    assignment_id TEXT,
+    kind TEXT,              -- 3d, 1d
+    fire_at_epoch INTEGER,  -- due_epoch minus the kind's lead time
+    sent_at INTEGER,        -- epoch seconds, NULL while pending
+    PRIMARY KEY (user_id, assignment_id, kind),
+    FOREIGN KEY (user_id) REFERENCES user(user_id),
+    FOREIGN KEY (assignment_id) REFERENCES assignment(assignment_id)
+)
+""")
 
+# Indexes for the notification window queries
+cur.execute("CREATE INDEX IF NOT EXISTS idx_assignment_due_epoch ON assignment(due_epoch)")
+# The notify flags are no longer scanned (notification_schedule replaced them), drop the old index's write cost
+cur.execute("DROP INDEX IF EXISTS idx_user_assignments_notify")
+cur.execute("CREATE INDEX IF NOT EXISTS idx_notification_schedule_pending ON notification_schedule(fire_at_epoch) WHERE sent_at IS NULL")
 
 conn.commit()
 conn.close()
 
+db = DBManager()
+db.backfill_due_epoch()
+db.backfill_course_year()
+db.backfill_notification_schedule()
+db.commit()
+db.close()
+
 conn = sqlite3.connect("database/log.db")
 cur = conn.cursor()
-cur.execute("""CREATE TABLE log (
+cur.execute("""CREATE TABLE IF NOT EXISTS log (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     timestamp TEXT DEFAULT (datetime('now', '+7 hours')),
     level TEXT,          -- INFO, WARNING, ERROR, DEBUG
@@ -67,6 +151,19 @@ cur.execute("""CREATE TABLE log (
     data TEXT            -- optional JSON blob (assignment_id, user_id etc.)
 );"""
 )
+cur.execute("CREATE INDEX IF NOT EXISTS idx_log_timestamp ON log(timestamp)")
+cur.execute("CREATE INDEX IF NOT EXISTS idx_log_source_level_timestamp ON log(source, level, timestamp)")
+
+# Daily counts of log rows removed by Utility/log_query.py prune
+cur.execute("""
+CREATE TABLE IF NOT EXISTS log_daily (
+    day TEXT,
+    source TEXT,
+    level TEXT,
+    count INTEGER,
+    PRIMARY KEY (day, source, level)
+)
+""")
 conn.commit()
 conn.close()
 
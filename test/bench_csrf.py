@@ -0,0 +1,27 @@
+# Run from the repo root: PYTHONPATH=. python test/bench_csrf.py
+import timeit
+from bs4 import BeautifulSoup
+from scraper.scraper import extract_csrf_token
+
+FIXTURES = ["test/login_page.html"]
+NUMBER = 500
+
+def bs4_extract(html_text):
+    """The previous extractor: full html.parser tree, then find the input."""
+    soup = BeautifulSoup(html_text, 'html.parser')
+    token_input = soup.find('input', {'name': '_token'})
+    return token_input.get('value') if token_input else None
+
+if __name__ == "__main__":
+    for path in FIXTURES:
+        with open(path, 'r', encoding='utf-8') as file:
+            page = file.read()
+        expected = bs4_extract(page)
+        assert extract_csrf_token(page) == expected, f"token mismatch for {path}"
+
+        old = timeit.timeit(lambda: bs4_extract(page), number=NUMBER)
+        new = timeit.timeit(lambda: extract_csrf_token(page), number=NUMBER)
+        print(f"{path} ({len(page)} chars, token={expected})")
+        print(f"  BeautifulSoup : {old / NUMBER * 1e6:9.1f} us/page")
+        print(f"  fast path     : {new / NUMBER * 1e6:9.1f} us/page")
+        print(f"  speedup       : {old / new:9.1f}x")
@@ -0,0 +1,60 @@
+# Pushes notifications for synthetic users through the local LINE stand-in, old loop vs PushDispatcher.
+# Run from the repo root: PYTHONPATH=. python test/bench_push.py --users 200 --latency 0.05
+import argparse
+import time
+
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+from linebot.v3.messaging.models import PushMessageRequest, TextMessage
+
+from mock_line import MockConfig, MockState, start_server
+from notifier.dispatcher import PushDispatcher
+
+
+def sequential_push(base_url, users):
+    """The previous loop: users one after another, a new ApiClient per batch of 5."""
+    for user_id, messages in users:
+        for i in range(0, len(messages), 5):
+            with ApiClient(Configuration(access_token="mock")) as api_client:
+                api = MessagingApi(api_client)
+                api.line_base_path = base_url
+                api.push_message(PushMessageRequest(to=user_id, messages=messages[i:i + 5]))
+
+
+def dispatched_push(base_url, users, workers, rate):
+    with PushDispatcher("mock", workers=workers, rate=rate, base_url=base_url) as dispatcher:
+        futures = [dispatcher.submit(user_id, messages) for user_id, messages in users]
+        results = [future.result() for future in futures]
+    return results, dispatcher.stats()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=7, help="messages per user (pushed 5 at a time)")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock response latency in seconds")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=100, help="dispatcher token bucket, requests/s")
+    parser.add_argument("--server-rate", type=float, default=0, help="mock 429s above this many requests/s")
+    args = parser.parse_args()
+
+    server, base_url = start_server()
+    MockConfig.latency = args.latency
+    MockConfig.retry_after = 1
+    users = [(f"U{i:032x}", [TextMessage(text=f"message {m}") for m in range(args.messages)]) for i in range(args.users)]
+    expected = args.users * args.messages
+
+    start = time.perf_counter()
+    sequential_push(base_url, users)
+    old = time.perf_counter() - start
+    assert sum(MockState.delivered.values()) == expected
+    print(f"sequential, ApiClient per batch : {old:6.2f}s")
+
+    MockState.reset()
+    MockConfig.rate = args.server_rate
+    start = time.perf_counter()
+    results, stats = dispatched_push(base_url, users, args.workers, args.rate)
+    new = time.perf_counter() - start
+    failed = [r for r in results if not r.ok]
+    assert sum(MockState.delivered.values()) == expected, f"{sum(MockState.delivered.values())} of {expected} delivered"
+    print(f"PushDispatcher ({args.workers} workers)   : {new:6.2f}s  {stats}, 429s={MockState.rate_limited}, failed={len(failed)}")
+    server.shutdown()
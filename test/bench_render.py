@@ -0,0 +1,101 @@
+# Renders the assignment/course Flex bubbles for 10k synthetic assignments, old and new way.
+# Run from the repo root: PYTHONPATH=. python test/bench_render.py
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytz
+from Utility.utility import calculate_time_left, get_assignment_state, replace_placeholders
+from notifier.flex_template import RenderCache
+from notifier.notify_engine import STATE_PROPERTIES, create_assingment_flex_body, create_crouse_flex_bubble, process_course_data
+
+N_ASSIGNMENTS = 10_000
+PER_COURSE = 8
+N_USERS = 1000          # users for the shared-course run
+COURSES_PER_USER = 5
+
+
+def synthetic_assignments(n, now):
+    statuses = ["ASSIGNED", "SUBMITTED", "OVERDUE"]
+    return [{
+        "courseID": f"0000-C{i // PER_COURSE:04d}",
+        "id": f"A{i:05d}",
+        "title": f"Assignment {i}",
+        "type": "INDIVIDUAL",
+        "status": statuses[i % 3],
+        "dueDate": (now + timedelta(hours=i % 200 - 20)).isoformat()
+    } for i in range(n)]
+
+
+def legacy_flex_body(assignment_info, current_time):
+    """The previous renderer: read the template, substitute <KEY> text, json.loads."""
+    time_left_str, total_seconds_left = calculate_time_left(assignment_info.get('dueDate', ''), current_time)
+    state = get_assignment_state(assignment_info.get('status', 'UNKNOWN'), total_seconds_left)
+    props = STATE_PROPERTIES.get(state, STATE_PROPERTIES["not_submitted_normal"])
+    template_data = {
+        "ASSIGNMENT_NAME": assignment_info.get("title", "N/A"),
+        "DUE_DATE": assignment_info.get("dueDate", "N/A"),
+        "TIME_LEFT": time_left_str,
+        "DETAIL_URL": f"https://alpha.mycourseville.com/course/{assignment_info['courseID']}/assignments/{assignment_info['id']}",
+        **props
+    }
+    with open('notifier/flex_body_template.json', 'r', encoding='utf-8') as file:
+        body_template = file.read()
+    return json.loads(replace_placeholders(body_template, template_data))
+
+
+if __name__ == "__main__":
+    now = datetime.now(pytz.timezone('Asia/Bangkok'))
+    assignments = synthetic_assignments(N_ASSIGNMENTS, now)
+    for a in assignments[:50]:
+        assert legacy_flex_body(a, now) == create_assingment_flex_body(a, now), f"render mismatch for {a['id']}"
+
+    # Titles the text substitution could not survive
+    tricky = dict(assignments[0], title='Lab "final" \\ part <2>')
+    body = create_assingment_flex_body(tricky, now)
+    assert body["contents"][0]["text"] == tricky["title"]
+    try:
+        legacy_flex_body(tricky, now)
+        print("legacy renderer accepted a quoted title")
+    except json.JSONDecodeError:
+        print("legacy renderer breaks on quoted titles, compiled template keeps them intact")
+
+    start = time.perf_counter()
+    for a in assignments:
+        legacy_flex_body(a, now)
+    old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for a in assignments:
+        create_assingment_flex_body(a, now)
+    new = time.perf_counter() - start
+
+    courses = [{"title": f"Course {c}", "assignments": assignments[c:c + PER_COURSE]}
+               for c in range(0, N_ASSIGNMENTS, PER_COURSE)]
+    start = time.perf_counter()
+    for course in courses:
+        create_crouse_flex_bubble(course, now)
+    bubbles = time.perf_counter() - start
+
+    print(f"{N_ASSIGNMENTS} assignment bodies")
+    print(f"  file + regex + json.loads : {old * 1e6 / N_ASSIGNMENTS:7.1f} us/assignment ({old:.2f}s)")
+    print(f"  compiled template         : {new * 1e6 / N_ASSIGNMENTS:7.1f} us/assignment ({new:.2f}s)")
+    print(f"  speedup                   : {old / new:7.1f}x")
+    print(f"{len(courses)} course bubbles  : {bubbles * 1e3:7.1f} ms total")
+
+    # Users drawn from a pool of sections, most of them share every bubble with someone
+    sections = [{"courseID": course["assignments"][0]["courseID"], **course} for course in courses[:60]]
+    users = [[sections[(u * 7 + k * 13) % len(sections)] for k in range(COURSES_PER_USER)] for u in range(N_USERS)]
+    start = time.perf_counter()
+    for course_list in users[:100]:
+        process_course_data(course_list, now)
+    uncached = (time.perf_counter() - start) * N_USERS / 100
+
+    cache = RenderCache()
+    start = time.perf_counter()
+    for course_list in users:
+        process_course_data(course_list, now, cache)
+    cached = time.perf_counter() - start
+    print(f"{N_USERS} users x {COURSES_PER_USER} courses ({len(sections)} distinct), FlexMessage included")
+    print(f"  uncached (extrapolated)   : {uncached:7.2f}s")
+    print(f"  run-wide render cache     : {cached:7.2f}s  {cache.stats()}")
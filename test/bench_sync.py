@@ -0,0 +1,108 @@
+# Throughput benchmark of the update_assm flow against test/mock_mcv.py.
+# Run from the repo root: PYTHONPATH=. python test/bench_sync.py --users 200 --workers 16 --latency 0.05
+# Works in a throwaway directory (fresh main.db/log.db and a generated RSA key pair).
+import argparse
+import os
+import runpy
+import statistics
+import tempfile
+import time
+
+from Crypto.PublicKey import RSA
+
+import scraper.scraper as cv
+import scraper.update_assm as update_assm
+from database.DB_manager import DBManager
+from Utility.Cipher import cipher
+from mock_mcv import MockConfig, start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_workdir(n_users):
+    """Create database/ and secret/ in a temp dir, run setup.py and register n_users."""
+    workdir = tempfile.mkdtemp(prefix="mcv_bench_")
+    os.chdir(workdir)
+    os.makedirs("database")
+    os.makedirs("secret")
+    key = RSA.generate(2048)
+    with open("secret/private_key.pem", "wb") as f:
+        f.write(key.export_key("PEM"))
+    with open("secret/public_key.pem", "wb") as f:
+        f.write(key.publickey().export_key("PEM"))
+    runpy.run_path(os.path.join(REPO_ROOT, "setup.py"))
+
+    c = cipher()
+    db = DBManager()
+    for i in range(n_users):
+        db.upsert_user({"user_id": f"u{i+1}", "cname": c.encrypt(f"student{i+1}"),
+                        "cpass": c.encrypt("password"), "Line_uid": f"L{i+1}"})
+    db.commit()
+    db.close()
+    return workdir
+
+
+def timed(fn, samples):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+def run_once(label, workers, processes=1, host_limit=4):
+    fetch_times, write_times = [], []
+    cv.transport_stats.reset()
+    update_assm.fetch_user = timed(fetch_user, fetch_times)
+    update_assm.write_user = timed(write_user, write_times)
+
+    db = DBManager()
+    n_users = db.count_all_user()
+    users = db.iter_users()     # streamed, as update_assm does
+    start = time.perf_counter()
+    if processes > 1:
+        # Per-user timings stay in the shard processes, only throughput is reported
+        totals = update_assm.sync_users_sharded(db, users, processes=processes, workers=workers, host_limit=host_limit)
+    else:
+        totals = update_assm.sync_users(db, users, workers=workers)
+    db.commit()
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    fetch_times.sort()
+    p99 = fetch_times[min(len(fetch_times) - 1, int(len(fetch_times) * 0.99))] if fetch_times else 0
+    print(f"[{label}] {n_users} users in {elapsed:.2f}s -> {n_users / elapsed:.1f} users/s")
+    if fetch_times:
+        print(f"  per-user latency p50={statistics.median(fetch_times) * 1000:.0f}ms p99={p99 * 1000:.0f}ms")
+    print(f"  DB write time total={sum(write_times) * 1000:.0f}ms rows={totals}")
+    print(f"  transport {cv.transport_stats.snapshot()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark update_assm against the local mock mCV.")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--host-limit", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=1, help="use sync_users_sharded with this many processes")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock latency per request (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--assignments", type=int, default=8)
+    args = parser.parse_args()
+
+    MockConfig.latency = args.latency
+    MockConfig.error_rate = args.error_rate
+    MockConfig.courses = args.courses
+    MockConfig.assignments = args.assignments
+    server, base_url = start_server()
+    cv.MCV_URL = cv.ALPHA_URL = cv.API_URL = base_url
+    cv.shared_adapter.set_max_per_host(args.host_limit)
+
+    fetch_user, write_user = update_assm.fetch_user, update_assm.write_user
+    print(f"workdir: {prepare_workdir(args.users)}")
+    # First pass logs every user in; the second reuses cached sessions and unchanged course hashes
+    run_once("cold", args.workers, args.processes, args.host_limit)
+    run_once("warm", args.workers, args.processes, args.host_limit)
+    server.shutdown()
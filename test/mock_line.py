@@ -0,0 +1,143 @@
+# Local stand-in for the LINE Messaging API push/multicast endpoints used by notifier/dispatcher.py.
+# Run from the repo root: PYTHONPATH=. python test/mock_line.py --port 8901 --latency 0.05 --rate 50
+# then point the notifier at it with LINE_API_URL=http://127.0.0.1:8901
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    """Knobs shared by every request handler."""
+    latency = 0.0       # seconds added to every response
+    error_rate = 0.0    # probability of answering 500
+    rate = 0.0          # accepted requests per second before answering 429, 0 for no limit
+    retry_after = 1     # Retry-After seconds sent with 429
+    reject_multicast = False    # answer 400 to every multicast (exercises the push fallback)
+    reject_multicast_nth = 0    # answer 400 to only the Nth multicast request (1-based), 0 for none
+
+
+class MockState:
+    """What the mock accepted, for the benchmark/test scripts to check."""
+    lock = threading.Lock()
+    requests = {}           # path -> accepted requests
+    delivered = {}          # LINE user id -> number of messages received
+    retry_keys = set()
+    rate_limited = 0
+    multicasts_seen = 0     # multicast requests received, accepted or not
+    window = [0.0, 0]       # [second, requests in it]
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.requests, cls.delivered, cls.retry_keys = {}, {}, set()
+            cls.rate_limited = cls.multicasts_seen = 0
+            cls.window = [0.0, 0]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def _over_rate(self):
+        if not MockConfig.rate:
+            return False
+        with MockState.lock:
+            second = int(time.monotonic())
+            if MockState.window[0] != second:
+                MockState.window = [second, 0]
+            MockState.window[1] += 1
+            if MockState.window[1] > MockConfig.rate:
+                MockState.rate_limited += 1
+                return True
+        return False
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if MockConfig.latency:
+            time.sleep(MockConfig.latency)
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._json(401, {"message": "Authentication failed"})
+            return
+        if self._over_rate():
+            self._json(429, {"message": "The API rate limit has been exceeded. Try again later."},
+                       {"Retry-After": str(MockConfig.retry_after)})
+            return
+        if MockConfig.error_rate and random.random() < MockConfig.error_rate:
+            self._json(500, {"message": "mock error"})
+            return
+        if self.path == "/v2/bot/message/push":
+            recipients = [body.get("to")]
+        elif self.path == "/v2/bot/message/multicast":
+            recipients = body.get("to", [])
+            with MockState.lock:
+                MockState.multicasts_seen += 1
+                nth = MockState.multicasts_seen
+            if MockConfig.reject_multicast or nth == MockConfig.reject_multicast_nth or not 1 <= len(recipients) <= 500:
+                self._json(400, {"message": "Size must be between 1 and 500"})
+                return
+        else:
+            self._json(404, {"message": "Not found"})
+            return
+        if len(body.get("messages", [])) > 5:
+            self._json(400, {"message": "Size must be between 1 and 5"})
+            return
+
+        retry_key = self.headers.get("X-Line-Retry-Key")
+        with MockState.lock:
+            duplicate = retry_key is not None and retry_key in MockState.retry_keys
+            if not duplicate:
+                if retry_key:
+                    MockState.retry_keys.add(retry_key)
+                MockState.requests[self.path] = MockState.requests.get(self.path, 0) + 1
+                for to in recipients:
+                    MockState.delivered[to] = MockState.delivered.get(to, 0) + len(body["messages"])
+        if duplicate:
+            self._json(409, {"message": "The retry key is already accepted"})
+            return
+        self._json(200, {"sentMessages": [{"id": str(random.getrandbits(60))} for _ in body["messages"]]})
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def start_server(port=0):
+    """Start the mock server on a background thread, returns (server, base_url)."""
+    server = MockServer(("127.0.0.1", port), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the LINE push and multicast endpoints.")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 500 per request")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second before 429, 0 for no limit")
+    args = parser.parse_args()
+    MockConfig.latency = args.latency
+    MockConfig.error_rate = args.error_rate
+    MockConfig.rate = args.rate
+    server, base_url = start_server(args.port)
+    print(f"Mock LINE API listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
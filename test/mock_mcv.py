@@ -0,0 +1,239 @@
+# Local stand-in for the mCV endpoints used by CVScraper/CVaScraper.
+# Run from the repo root: PYTHONPATH=. python test/mock_mcv.py --port 8900 --latency 0.05
+# then point the scraper at it with MCV_URL/MCV_ALPHA_URL/MCV_API_URL=http://127.0.0.1:8900
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CLIENT_ID = "mockclientid0123456789abcdef"
+BUNDLE_PATH = "/assets/index-Mock0001.js"
+LOGIN_PAGE = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "login_page.html"), "r", encoding="utf-8").read()
+
+
+class MockConfig:
+    """Knobs shared by every request handler."""
+    latency = 0.0           # seconds added to every response
+    error_rate = 0.0        # probability of answering 503
+    courses = 5             # courses per user
+    assignments = 8         # assignments per course
+    bundle_padding = 200_000  # bytes of filler around the client_id in the JS bundle
+    refresh_endpoint = True   # False answers 404 on /auth/refresh (it is unverified on the real mCV)
+
+
+def synthetic_courses(username, semester, year):
+    """Deterministic per-user course/assignment payload in the /query response shape."""
+    rng = random.Random(f"{username}-{semester}-{year}")
+    # Anchor on today's midnight so repeated runs return identical payloads within a day
+    now = datetime.now(timezone(timedelta(hours=7))).replace(hour=0, minute=0, second=0, microsecond=0)
+    courses = []
+    # Course ids are shared across users so assignments overlap like real sections do
+    picks = rng.sample(range(MockConfig.courses * 4), MockConfig.courses)
+    for c, pick in enumerate(picks):
+        course_id = f"0000-C{pick:03d}"
+        course_rng = random.Random(course_id)   # assignment fields are the same for every student
+        assignments = []
+        for a in range(MockConfig.assignments):
+            due = now + timedelta(hours=course_rng.randrange(-24 * 30, 24 * 30))
+            assignments.append({
+                "courseID": course_id,
+                "id": f"{course_id}-A{a:02d}",
+                "title": f"Assignment {a} of {course_id}",
+                "type": course_rng.choice(["INDIVIDUAL", "GROUP"]),
+                "status": rng.choice(["ASSIGNED", "SUBMITTED", "OVERDUE"]),
+                "outDate": (due - timedelta(days=7)).isoformat(),
+                "dueDate": due.isoformat()
+            })
+        courses.append({
+            "courseID": course_id,
+            "title": f"Course {course_id}",
+            "courseNumber": f"21{c:05d}",
+            "courseYear": str(year),
+            "thumbnail": "https://www.mycourseville.com/sites/all/modules/courseville/files/thumbs/icon-default.png",
+            "semester": str(semester),
+            "assignments": assignments
+        })
+    return courses
+
+
+def requested_fields(query):
+    """Course and assignment fields of the query's `student {...}` selection, None when it has no such selection."""
+    match = re.search(r"student\s*\{([\w\s]*)assignments\([^)]*\)\s*\{([\w\s]*)\}", query)
+    if not match:
+        return None
+    return match.group(1).split(), match.group(2).split()
+
+
+def select_fields(courses, fields):
+    """Keep only the requested fields, like a GraphQL server answering that selection."""
+    if fields is None:
+        return courses
+    course_fields, assignment_fields = fields
+    return [{
+        **{k: course[k] for k in course_fields if k in course},
+        "assignments": [{k: a[k] for k in assignment_fields if k in a} for a in course["assignments"]]
+    } for course in courses]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024    # send headers and body in one segment (avoids delayed-ACK stalls)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        headers = dict(headers or {})
+        if len(body) > 512 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def _json(self, status, data):
+        self._send(status, json.dumps(data), "application/json")
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _cookie(self, name):
+        match = re.search(rf"{name}=([^;]+)", self.headers.get("Cookie", ""))
+        return match.group(1) if match else None
+
+    def _degrade(self):
+        """Apply configured latency and error rate, returns True when the request was failed."""
+        if MockConfig.latency:
+            time.sleep(MockConfig.latency)
+        if MockConfig.error_rate and random.random() < MockConfig.error_rate:
+            self._body()
+            self._send(503, "mock error")
+            return True
+        return False
+
+    def do_GET(self):
+        if self._degrade():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/":
+            # Serves both the mCV homepage/dashboard and the alpha entry page
+            page = f'<html><head><script type="module" crossorigin src="{BUNDLE_PATH}"></script></head><body>2024</body></html>'
+            self._send(200, page, headers={"Set-Cookie": "mcv_session=mock; Path=/"})
+        elif url.path == "/api/oauth/authorize":
+            if query.get("client_id") == ["mycourseville.com"]:
+                self._send(200, LOGIN_PAGE)
+                return
+            username = self._cookie("mcv_user")
+            if not username:
+                self._send(401, "not logged in")
+                return
+            self._send(302, headers={"Location": f"https://alpha.mycourseville.com/?code={username}&state=/course"})
+        elif url.path.startswith("/assets/index-"):
+            if url.path != BUNDLE_PATH:
+                self._send(404, "not found")
+                return
+            etag = '"mock-bundle-1"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, headers={"ETag": etag})
+                return
+            filler = "x" * (MockConfig.bundle_padding // 2)
+            js = f'{filler}const u="https://www.mycourseville.com/api/oauth/authorize?client_id={CLIENT_ID}";{filler}'
+            self._send(200, js, "application/javascript", {"ETag": etag})
+        else:
+            self._send(404, "not found")
+
+    def do_POST(self):
+        if self._degrade():
+            return
+        url = urlparse(self.path)
+        body = self._body()
+        if url.path == "/api/chulalogin":
+            form = parse_qs(body.decode("utf-8"))
+            username = form.get("username", [""])[0]
+            if not form.get("_token") or not username:
+                self._send(419, "bad login")
+                return
+            self._send(200, "<html>2024</html>", headers={"Set-Cookie": f"mcv_user={username}; Path=/"})
+        elif url.path == "/auth/login":
+            code = json.loads(body)["code"]
+            self._json(200, {"access_token": f"tok-{code}", "refresh_token": f"ref-{code}", "expires_in": 3600})
+        elif url.path == "/auth/refresh" and MockConfig.refresh_endpoint:
+            refresh = json.loads(body).get("refresh_token", "")
+            if not refresh.startswith("ref-"):
+                self._json(401, {"message": "invalid refresh token"})
+                return
+            username = refresh[4:]
+            self._json(200, {"access_token": f"tok-{username}", "refresh_token": refresh, "expires_in": 3600})
+        elif url.path == "/query":
+            auth = self.headers.get("Authorization", "")
+            if not auth.startswith("Bearer tok-"):
+                self._json(401, {"message": "unauthorized"})
+                return
+            username = auth[len("Bearer tok-"):]
+            request = json.loads(body)
+            variables = request["variables"]
+            fields = requested_fields(request.get("query", ""))
+            if "semester" in variables:
+                me = {"myCoursesBySemester": {"student": select_fields(
+                    synthetic_courses(username, variables["semester"], variables["year"]), fields)}}
+            else:
+                # Aliased batch query: s0, s1, ... with $semesterN/$yearN
+                me = {}
+                i = 0
+                while f"semester{i}" in variables:
+                    me[f"s{i}"] = {"student": select_fields(
+                        synthetic_courses(username, variables[f"semester{i}"], variables[f"year{i}"]), fields)}
+                    i += 1
+            self._json(200, {"data": {"me": me}})
+        else:
+            self._send(404, "not found")
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing streamed responses early (client_id search) reset the socket
+        pass
+
+
+def start_server(port=0):
+    """Start the mock server on a background thread, returns (server, base_url)."""
+    server = MockServer(("127.0.0.1", port), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the mCV endpoints used by the scraper.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 503 per request")
+    parser.add_argument("--courses", type=int, default=5, help="courses per user")
+    parser.add_argument("--assignments", type=int, default=8, help="assignments per course")
+    args = parser.parse_args()
+    MockConfig.latency = args.latency
+    MockConfig.error_rate = args.error_rate
+    MockConfig.courses = args.courses
+    MockConfig.assignments = args.assignments
+    server, base_url = start_server(args.port)
+    print(f"Mock mCV listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
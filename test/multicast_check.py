@@ -0,0 +1,133 @@
+# Sends one notification run for synthetic users through the local LINE stand-in and checks that
+# users with identical payloads are multicast, everyone gets their messages exactly once, and a
+# rejected multicast falls back to per-user pushes of the messages it did not deliver.
+# Run from the repo root: PYTHONPATH=. python test/multicast_check.py
+import os
+import runpy
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from mock_line import MockConfig, MockState, start_server
+from database.DB_manager import DBManager
+from notifier.dispatcher import PushDispatcher, MULTICAST_LIMIT
+from notifier.flex_template import RenderCache
+from notifier.notify_engine import iter_notify_groups, dispatch_notifications
+from scraper.update_assm import write_user
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_USERS = 1200     # same two sections, same statuses: one payload
+UNIQUE_USERS = 30       # one private section each: one payload per user
+CHUNK_USERS = 400       # users per iter_notify_groups chunk in the chunked run
+PARTIAL_USERS = 3       # share PARTIAL_SECTIONS sections: 7 messages, two multicast requests
+PARTIAL_SECTIONS = 7
+
+
+def section(course_id, now, n_assignments=3, status="ASSIGNED"):
+    return {
+        "courseID": course_id,
+        "title": f"Course {course_id}",
+        "courseNumber": course_id[-5:],
+        "thumbnail": "https://www.mycourseville.com/thumb.png",
+        "semester": "1",
+        "assignments": [{
+            "courseID": course_id,
+            "id": f"{course_id}-A{a}",
+            "title": f"Assignment {a} of {course_id}",
+            "type": "INDIVIDUAL",
+            "status": status,
+            "dueDate": (now + timedelta(hours=30 + 12 * a)).isoformat()
+        } for a in range(n_assignments)]
+    }
+
+
+def seed(db, now):
+    users = {}
+    shared = [section("0000-SHARED1", now), section("0000-SHARED2", now)]
+    for i in range(SHARED_USERS + UNIQUE_USERS):
+        user_id = f"u{i}"
+        courses = shared if i < SHARED_USERS else [section(f"0000-OWN{i:05d}", now)]
+        db.cur.execute("INSERT INTO user (user_id, cname, cpass, Line_uid) VALUES (?, '', '', ?)", (user_id, f"L{i}"))
+        with db.transaction():
+            write_user(db, user_id, courses)
+        users[f"L{i}"] = len(courses)
+    db.commit()
+    return users
+
+
+def seed_partial(db, now):
+    """Replaces the seeded users with PARTIAL_USERS users sharing PARTIAL_SECTIONS sections."""
+    for table in ("notification_schedule", "user_assignments", "course_sync", "assignment", "course", "user"):
+        db.cur.execute(f"DELETE FROM {table}")
+    shared = [section(f"0000-PART{s}", now) for s in range(PARTIAL_SECTIONS)]
+    for i in range(PARTIAL_USERS):
+        db.cur.execute("INSERT INTO user (user_id, cname, cpass, Line_uid) VALUES (?, '', '', ?)", (f"u{i}", f"L{i}"))
+        with db.transaction():
+            write_user(db, f"u{i}", shared)
+    db.commit()
+    return {f"L{i}": PARTIAL_SECTIONS for i in range(PARTIAL_USERS)}
+
+
+def run(db, base_url, now, **chunking):
+    MockState.reset()
+    sent_flags = []
+    n_groups = n_users = 0
+    with PushDispatcher("mock", workers=8, rate=1000, base_url=base_url) as dispatcher:
+        for groups, chunk_users in iter_notify_groups(db, now, sent_flags, RenderCache(), **chunking):
+            n_groups += len(groups)
+            n_users += chunk_users
+            dispatch_notifications(dispatcher, groups, sent_flags)
+    return n_groups, n_users, sent_flags
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp(prefix="mcv_multicast_"))
+    os.makedirs("database")
+    runpy.run_path(os.path.join(REPO_ROOT, "setup.py"))
+    server, base_url = start_server()
+    db = DBManager()
+    now = int(time.time())
+    expected = seed(db, datetime.fromtimestamp(now, timezone(timedelta(hours=7))))
+
+    n_groups, n_users, sent_flags = run(db, base_url, now)
+    assert n_users == len(expected), f"{n_users} due users, expected {len(expected)}"
+    assert n_groups == UNIQUE_USERS + 1, f"{n_groups} payloads, expected {UNIQUE_USERS + 1}"
+    assert MockState.delivered == expected, "every user gets each of their messages exactly once"
+    multicasts = MockState.requests.get("/v2/bot/message/multicast", 0)
+    pushes = MockState.requests.get("/v2/bot/message/push", 0)
+    assert multicasts == -(-SHARED_USERS // MULTICAST_LIMIT) and pushes == UNIQUE_USERS
+    print(f"[ok] {n_users} users, {n_groups} payloads -> {multicasts} multicasts + {pushes} pushes "
+          f"(was {n_users} pushes), {len(sent_flags)} flags")
+
+    # Rendered and sent in chunks of CHUNK_USERS, memory stays bounded and nobody is sent twice
+    all_flags = len(sent_flags)
+    n_groups, n_users, sent_flags = run(db, base_url, now, chunk_users=CHUNK_USERS)
+    assert n_users == len(expected) and len(sent_flags) == all_flags
+    assert MockState.delivered == expected
+    multicasts = MockState.requests.get("/v2/bot/message/multicast", 0)
+    pushes = MockState.requests.get("/v2/bot/message/push", 0)
+    print(f"[ok] chunks of {CHUNK_USERS} users -> {n_groups} payloads, {multicasts} multicasts + {pushes} pushes")
+
+    MockConfig.reject_multicast = True
+    n_groups, n_users, sent_flags = run(db, base_url, now)
+    assert MockState.delivered == expected
+    pushes = MockState.requests.get("/v2/bot/message/push", 0)
+    assert pushes == n_users
+    print(f"[ok] multicast rejected -> {pushes} per-user pushes, {len(sent_flags)} flags")
+
+    # The first multicast request (messages 1-5) goes through, the second (6-7) is rejected:
+    # the fallback pushes must only carry messages 6-7
+    MockConfig.reject_multicast = False
+    MockConfig.reject_multicast_nth = 2
+    expected = seed_partial(db, datetime.fromtimestamp(now, timezone(timedelta(hours=7))))
+    n_groups, n_users, sent_flags = run(db, base_url, now)
+    assert MockState.delivered == expected, f"{MockState.delivered}, expected {expected}"
+    multicasts = MockState.requests.get("/v2/bot/message/multicast", 0)
+    pushes = MockState.requests.get("/v2/bot/message/push", 0)
+    assert multicasts == 1 and pushes == PARTIAL_USERS
+    assert {uid for uid, _, _, _ in sent_flags} == {f"u{i}" for i in range(PARTIAL_USERS)}
+    print(f"[ok] second multicast rejected -> {pushes} pushes of the rest, "
+          f"each user got {PARTIAL_SECTIONS} messages, {len(sent_flags)} flags")
+
+    db.close()
+    server.shutdown()
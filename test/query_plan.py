@@ -0,0 +1,39 @@
+# Checks that the notification window queries keep using their indexes.
+# Run from the repo root: PYTHONPATH=. python test/query_plan.py
+import os
+import runpy
+import tempfile
+
+from database.DB_manager import DBManager, FETCH_SCHEDULED_ROWS_SQL
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# query -> index names that must appear in its plan
+EXPECTED = {
+    "FETCH_SCHEDULED_ROWS_SQL": (FETCH_SCHEDULED_ROWS_SQL, {"now": 0, "live_1d": -1, "live_3d": -2, "d7": 7},
+                                 ["idx_notification_schedule_pending", "sqlite_autoindex_notification_schedule_1"]),
+}
+
+
+def query_plan(db, sql, params):
+    db.cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[3] for row in db.cur.fetchall()]
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp(prefix="mcv_plan_"))
+    os.makedirs("database")
+    runpy.run_path(os.path.join(REPO_ROOT, "setup.py"))
+    db = DBManager()
+    failed = False
+    for name, (sql, params, indexes) in EXPECTED.items():
+        plan = query_plan(db, sql, params)
+        missing = [index for index in indexes if not any(index in step for step in plan)]
+        full_scans = [step for step in plan if step.startswith(("SCAN a", "SCAN ua", "SCAN s"))]
+        status = "FAIL" if missing or full_scans else "ok"
+        failed |= status == "FAIL"
+        print(f"[{status}] {name}")
+        for step in plan:
+            print(f"    {step}")
+    db.close()
+    raise SystemExit(1 if failed else 0)
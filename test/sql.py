@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
 import sqlite3
+from Utility.utility import to_epoch
+from database.DB_manager import NOTIFY_LEAD_SQL
 
 conn = sqlite3.connect("database/main.db")
 cur = conn.cursor()
@@ -16,7 +18,9 @@ updates = {
 for assignment_id, due_date in updates.items():
     iso_date = due_date.isoformat()
     cur.execute("UPDATE user_assignments SET status = 'ASSIGNED', notify_1d = false, notify_3d = false WHERE assignment_id = ?", (assignment_id,))
-    cur.execute("UPDATE assignment SET due_date = ? WHERE assignment_id = ?", (iso_date, assignment_id))
+    cur.execute("UPDATE assignment SET due_date = ?, due_epoch = ? WHERE assignment_id = ?", (iso_date, to_epoch(iso_date), assignment_id))
+    # Reminders of the moved assignments fire again
+    cur.execute(f"UPDATE notification_schedule SET fire_at_epoch = ? - ({NOTIFY_LEAD_SQL}), sent_at = NULL WHERE assignment_id = ?", (to_epoch(iso_date), assignment_id))
 
 
 